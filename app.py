@@ -356,75 +356,62 @@ def engineer_compound_features(df):
     return features
 
 def calculate_risk_scores(features):
-    """Calculate risk scores based on engineered features"""
+    """Calculate risk scores based on engineered features
+
+    Every rule is an array op over the whole frame. Bonuses are added one rule at
+    a time in the original order, and min/max keep Python's comparison semantics,
+    so the float arithmetic and the scores are the same as scoring row by row.
+    """
     if features.empty:
         return features
-    
-    scores = []
-    
-    for _, row in features.iterrows():
-        # Base score starts at 500 (neutral)
-        score = 500
-        
-        # Transaction history bonus (up to +200 points)
-        if row['total_transactions'] > 0:
-            tx_bonus = min(100, row['total_transactions'] * 2)  # 2 points per transaction, max 100
-            age_bonus = min(100, row['wallet_age_days'] * 0.5)  # 0.5 points per day, max 100
-            score += tx_bonus + age_bonus
-        else:
-            # No transaction history = significant risk
-            score -= 300
-        
-        # Liquidation penalty (severe)
-        if row['has_liquidation']:
-            score -= 400  # Heavy penalty for liquidations
-        
-        liquidation_penalty = row['liquidation_ratio'] * 300
-        score -= liquidation_penalty
-        
-        # Borrow/Repay behavior (up to +/-150 points)
-        if row['num_borrows'] > 0:
-            if row['borrow_repay_ratio'] >= 1.0:
-                score += 150  # Good repayment behavior
-            elif row['borrow_repay_ratio'] >= 0.8:
-                score += 100  # Decent repayment
-            elif row['borrow_repay_ratio'] >= 0.5:
-                score += 50   # Moderate repayment
-            else:
-                score -= 100  # Poor repayment history
-        
-        # Activity frequency bonus/penalty
-        if row['tx_frequency_per_day'] > 1:
-            score += 50   # Very active user
-        elif row['tx_frequency_per_day'] > 0.1:
-            score += 25   # Moderately active
-        
-        # Recent activity bonus
-        if row['recent_activity'] < 30:  # Active in last 30 days
-            score += 50
-        elif row['recent_activity'] < 90:  # Active in last 90 days
-            score += 25
-        elif row['recent_activity'] > 365:  # Inactive for over a year
-            score -= 100
-        
-        # Diversification bonus
-        if row['unique_contracts'] > 3:
-            score += 30
-        elif row['unique_contracts'] > 1:
-            score += 15
-        
-        # Gas efficiency (proxy for sophistication)
-        if row['avg_gas_per_tx'] > 0:
-            if row['avg_gas_per_tx'] < 100000:  # Efficient gas usage
-                score += 25
-            elif row['avg_gas_per_tx'] > 500000:  # Wasteful gas usage
-                score -= 25
-        
-        # Ensure score is within bounds
-        score = max(0, min(1000, score))
-        scores.append(round(score))
-    
-    features['score'] = scores
+
+    column = lambda name: features[name].to_numpy(dtype=np.float64)
+    total_transactions = column('total_transactions')
+    borrow_repay_ratio = column('borrow_repay_ratio')
+    tx_frequency = column('tx_frequency_per_day')
+    recent_activity = column('recent_activity')
+    unique_contracts = column('unique_contracts')
+    avg_gas = column('avg_gas_per_tx')
+
+    # Base score starts at 500 (neutral)
+    score = np.full(len(features), 500.0)
+
+    # Transaction history bonus (up to +200 points)
+    tx_bonus = total_transactions * 2  # 2 points per transaction, max 100
+    tx_bonus = np.where(tx_bonus < 100, tx_bonus, 100)
+    age_bonus = column('wallet_age_days') * 0.5  # 0.5 points per day, max 100
+    age_bonus = np.where(age_bonus < 100, age_bonus, 100)
+    # No transaction history = significant risk
+    score = np.where(total_transactions > 0, score + (tx_bonus + age_bonus), score - 300)
+
+    # Liquidation penalty (severe)
+    score -= np.where(column('has_liquidation') != 0, 400, 0)  # Heavy penalty for liquidations
+    score -= column('liquidation_ratio') * 300
+
+    # Borrow/Repay behavior (up to +/-150 points)
+    score += np.where(column('num_borrows') > 0,
+                      np.select([borrow_repay_ratio >= 1.0,   # Good repayment behavior
+                                 borrow_repay_ratio >= 0.8,   # Decent repayment
+                                 borrow_repay_ratio >= 0.5],  # Moderate repayment
+                                [150, 100, 50], -100),        # Poor repayment history
+                      0)
+
+    # Activity frequency bonus/penalty
+    score += np.select([tx_frequency > 1, tx_frequency > 0.1], [50, 25], 0)
+
+    # Recent activity bonus: last 30 days, last 90 days, inactive for over a year
+    score += np.select([recent_activity < 30, recent_activity < 90, recent_activity > 365], [50, 25, -100], 0)
+
+    # Diversification bonus
+    score += np.select([unique_contracts > 3, unique_contracts > 1], [30, 15], 0)
+
+    # Gas efficiency (proxy for sophistication): efficient vs wasteful gas usage
+    score += np.select([(avg_gas > 0) & (avg_gas < 100000), (avg_gas > 0) & (avg_gas > 500000)], [25, -25], 0)
+
+    # Ensure score is within bounds; rint rounds half to even like round()
+    score = np.where(score < 1000, score, 1000)
+    score = np.where(score > 0, score, 0)
+    features['score'] = np.rint(score).astype(np.int64)
     return features
 
 def main():
@@ -0,0 +1,578 @@
+import argparse
+import contextlib
+import copy
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.metrics import adjusted_rand_score
+from sklearn.preprocessing import StandardScaler
+
+from main import (COMPOUND_ACTIONS, DEFAULT_SCORING_RULES, COMPOUND_CONTRACT_NAMES, FEATURE_SOURCE_COLUMNS, FEATURE_SOURCE_DTYPES,
+                  RAW_TRANSACTIONS_FILE, CompoundDataCollector, RawTransactionStore, calculate_risk_scores,
+                  compact_features, engineer_compound_features, engineer_compound_features_from_store, load_wallet_addresses,
+                  memory_mb, ScoringRuleSets, window_features_from_chunks)
+from replay_server import ReplayServer, load_fixtures
+
+# Offline benchmarks for the scoring pipeline. Every benchmark runs against
+# local data (replay_server.py for collection), so results are reproducible
+# on a laptop without network access or API keys.
+
+def benchmark_collection(args):
+    """Wallets/sec for the sequential and thread-pool collectors against a replay server"""
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else {}
+    if fixtures:
+        wallets = sorted(fixtures)[:args.wallets]
+    else:
+        wallets = ['0x%040x' % (i + 1) for i in range(args.wallets)]
+    synthetic = {'mean_transactions': args.mean_transactions, 'heavy_fraction': args.heavy_fraction}
+
+    print(f"Collection benchmark: {len(wallets)} wallets, {args.latency * 1000:.0f} ms latency, "
+          f"error rate {args.error_rate}, {args.requests_per_second} req/s per key x {args.keys} key(s)")
+    print(f"{'workers':>8} {'seconds':>9} {'wallets/s':>10} {'requests':>9} {'throttled':>10} {'txs':>8}")
+    for workers in args.workers:
+        with ReplayServer(dict(fixtures), synthetic, latency=args.latency, error_rate=args.error_rate,
+                          requests_per_second=args.requests_per_second) as server:
+            keys = [f"bench-key-{i}" for i in range(args.keys)]
+            collector = CompoundDataCollector(keys, requests_per_second=args.requests_per_second,
+                                              max_workers=workers, base_url=server.url)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):  # per-wallet progress lines
+                df = collector.process_wallet_data(wallets)
+            elapsed = time.perf_counter() - started
+        print(f"{workers:>8} {elapsed:>9.2f} {len(wallets) / elapsed:>10.1f} "
+              f"{server.stats['requests']:>9} {server.stats['throttled']:>10} {len(df):>8}")
+
+def reference_engineer_compound_features(df, wallet_addresses):
+    """The original per-group apply implementation, kept as the equivalence baseline"""
+    df = df[df['is_error'] == False].copy()
+    grouped = df.groupby('userWallet')
+    features = pd.DataFrame({
+        'userWallet': grouped.groups.keys(),
+        'total_transactions': grouped.size(),
+        'num_supplies': grouped.apply(lambda x: (x['action'] == 'supply').sum(), include_groups=False),
+        'num_borrows': grouped.apply(lambda x: (x['action'] == 'borrow').sum(), include_groups=False),
+        'num_repays': grouped.apply(lambda x: (x['action'] == 'repay').sum(), include_groups=False),
+        'num_redeems': grouped.apply(lambda x: (x['action'] == 'redeem').sum(), include_groups=False),
+        'num_withdraws': grouped.apply(lambda x: (x['action'] == 'withdraw').sum(), include_groups=False),
+        'num_liquidations': grouped.apply(lambda x: (x['action'] == 'liquidation').sum(), include_groups=False),
+        'unique_contracts': grouped['contract_name'].nunique(),
+        'total_gas_used': grouped['gas_used'].sum(),
+        'avg_gas_per_tx': grouped['gas_used'].mean(),
+        'wallet_age_days': grouped['timestamp'].apply(lambda x: (x.max() - x.min()) / (24 * 3600) if len(x) > 1 else 0),
+        'tx_frequency_per_day': grouped.apply(lambda x: len(x) / max(1, (x['timestamp'].max() - x['timestamp'].min()) / (24 * 3600)) if len(x) > 1 else 0, include_groups=False),
+        'has_liquidation': grouped.apply(lambda x: (x['action'] == 'liquidation').any().astype(int), include_groups=False),
+        'liquidation_ratio': grouped.apply(lambda x: (x['action'] == 'liquidation').sum() / len(x), include_groups=False),
+        'borrow_repay_ratio': grouped.apply(lambda x: x[x['action'] == 'repay'].shape[0] / max(1, x[x['action'] == 'borrow'].shape[0]), include_groups=False),
+        'supply_redeem_ratio': grouped.apply(lambda x: x[x['action'].isin(['redeem', 'withdraw'])].shape[0] / max(1, x[x['action'] == 'supply'].shape[0]), include_groups=False),
+        'diversification_score': grouped['contract_name'].apply(lambda x: len(x.unique()) / len(x) if len(x) > 0 else 0),
+        'recent_activity': grouped['timestamp'].apply(lambda x: (time.time() - x.max()) / (24 * 3600))
+    }).fillna(0).reset_index(drop=True)
+    all_wallets_df = pd.DataFrame({'userWallet': wallet_addresses})
+    features = all_wallets_df.merge(features, on='userWallet', how='left').fillna(0)
+    features.loc[features['recent_activity'] == 0, 'recent_activity'] = 99999
+    return features
+
+def synthetic_compound_transactions(n_wallets, mean_transactions=20, seed=0):
+    """Filtered-transaction frame shaped like the collector output, for feature benchmarks"""
+    rng = np.random.default_rng(seed)
+    wallets = np.array(['0x%040x' % (i + 1) for i in range(n_wallets)], dtype=object)
+    per_wallet = rng.poisson(mean_transactions, n_wallets)
+    n = int(per_wallet.sum())
+    return pd.DataFrame({
+        'userWallet': np.repeat(wallets, per_wallet),
+        'timestamp': rng.integers(1_560_000_000, 1_750_000_000, n),
+        'action': rng.choice(COMPOUND_ACTIONS, n, p=[0.35, 0.05, 0.2, 0.2, 0.18, 0.02]),
+        'contract_name': rng.choice(COMPOUND_CONTRACT_NAMES, n),
+        'gas_used': rng.integers(21_000, 800_000, n),
+        'is_error': rng.random(n) < 0.02,
+    }), list(wallets)
+
+def check_feature_equivalence(features, reference, label, against="the reference implementation"):
+    """Assert two feature frames match; recent_activity is wall-clock based so gets a tolerance"""
+    pd.testing.assert_frame_equal(features.drop(columns=['recent_activity']),
+                                  reference.drop(columns=['recent_activity']), check_dtype=False, check_exact=True)
+    np.testing.assert_allclose(features['recent_activity'], reference['recent_activity'], atol=1e-3)
+    print(f"{label}: identical to {against} ({len(features)} wallets)")
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def reference_calculate_risk_scores(features):
+    """The original row-by-row scorer, kept as the bit-identical baseline for the columnar one"""
+    scores = []
+    for _, row in features.iterrows():
+        score = 500
+        if row['total_transactions'] > 0:
+            tx_bonus = min(100, row['total_transactions'] * 2)
+            age_bonus = min(100, row['wallet_age_days'] * 0.5)
+            score += tx_bonus + age_bonus
+        else:
+            score -= 300
+        if row['has_liquidation']:
+            score -= 400
+        liquidation_penalty = row['liquidation_ratio'] * 300
+        score -= liquidation_penalty
+        if row['num_borrows'] > 0:
+            if row['borrow_repay_ratio'] >= 1.0:
+                score += 150
+            elif row['borrow_repay_ratio'] >= 0.8:
+                score += 100
+            elif row['borrow_repay_ratio'] >= 0.5:
+                score += 50
+            else:
+                score -= 100
+        if row['tx_frequency_per_day'] > 1:
+            score += 50
+        elif row['tx_frequency_per_day'] > 0.1:
+            score += 25
+        if row['recent_activity'] < 30:
+            score += 50
+        elif row['recent_activity'] < 90:
+            score += 25
+        elif row['recent_activity'] > 365:
+            score -= 100
+        if row['unique_contracts'] > 3:
+            score += 30
+        elif row['unique_contracts'] > 1:
+            score += 15
+        if row['avg_gas_per_tx'] > 0:
+            if row['avg_gas_per_tx'] < 100000:
+                score += 25
+            elif row['avg_gas_per_tx'] > 500000:
+                score -= 25
+        score = max(0, min(1000, score))
+        scores.append(round(score))
+    return pd.Series(scores, index=features.index, name='score')
+
+def synthetic_wallet_features(n_wallets, seed=0):
+    """Compact feature frame for scoring benchmarks, with a share of values on the rule thresholds"""
+    rng = np.random.default_rng(seed)
+    edge = lambda values, random: np.where(rng.random(n_wallets) < 0.2, rng.choice(values, n_wallets), random)
+    total_transactions = edge([0, 1, 49, 50, 51], rng.poisson(3, n_wallets) * (rng.random(n_wallets) < 0.7))
+    num_liquidations = rng.binomial(total_transactions, 0.05)
+    return pd.DataFrame({
+        'userWallet': pd.Categorical(['0x%040x' % (i + 1) for i in range(n_wallets)]),
+        'total_transactions': total_transactions.astype(np.int32),
+        'num_borrows': rng.binomial(total_transactions, 0.2).astype(np.int32),
+        'unique_contracts': edge([0, 1, 2, 3, 4], rng.integers(0, 8, n_wallets)).astype(np.int8),
+        'avg_gas_per_tx': edge([0.0, 99999.5, 100000.0, 500000.0, 500000.5], rng.uniform(0, 800_000, n_wallets)),
+        'wallet_age_days': edge([0.0, 199.0, 200.0, 201.0, 0.1, 0.3], rng.exponential(150, n_wallets)),
+        'tx_frequency_per_day': edge([0.0, 0.1, 1.0, 1 / 3], rng.exponential(0.5, n_wallets)),
+        'has_liquidation': (num_liquidations > 0).astype(np.int8),
+        'liquidation_ratio': np.divide(num_liquidations, total_transactions, out=np.zeros(n_wallets),
+                                       where=total_transactions > 0),
+        'borrow_repay_ratio': edge([0.0, 0.5, 0.8, 1.0, 0.7999999999999999], rng.uniform(0, 1.5, n_wallets)),
+        'recent_activity': edge([29.999, 30.0, 90.0, 365.0, 365.5, 99999.0], rng.exponential(200, n_wallets)),
+    })
+
+def benchmark_features(args):
+    """Equivalence with the reference implementation, then timings on synthetic data"""
+    df = pd.read_csv(args.raw)
+    with contextlib.redirect_stdout(io.StringIO()):
+        wallets = load_wallet_addresses(args.wallet_file)
+    check_feature_equivalence(engineer_compound_features(df, wallets),
+                              reference_engineer_compound_features(df, wallets), args.raw)
+
+    print(f"{'wallets':>9} {'txs':>10} {'reference s':>12} {'vectorized s':>13} {'speedup':>8}")
+    for n_wallets in args.sizes:
+        df, wallets = synthetic_compound_transactions(n_wallets, args.mean_transactions)
+        features, fast = timed(engineer_compound_features, df, wallets)
+        if n_wallets <= args.reference_max:
+            reference, slow = timed(reference_engineer_compound_features, df, wallets)
+            check_feature_equivalence(features, reference, f"  synthetic {n_wallets}")
+            print(f"{n_wallets:>9} {len(df):>10} {slow:>12.3f} {fast:>13.3f} {slow / fast:>7.1f}x")
+        else:
+            print(f"{n_wallets:>9} {len(df):>10} {'-':>12} {fast:>13.3f} {'-':>8}")
+
+def benchmark_scores(args):
+    """Columnar scorer vs the row-by-row reference; the reference runs on at most --reference-max wallets"""
+    print(f"{'wallets':>9} {'reference s':>12} {'columnar s':>11} {'speedup':>8}")
+    for n_wallets in args.sizes:
+        features = synthetic_wallet_features(n_wallets)
+        scored, fast = timed(calculate_risk_scores, features.copy())
+        sample = features.iloc[:args.reference_max]
+        reference, slow = timed(reference_calculate_risk_scores, sample)
+        # Scores must match exactly, not within a tolerance
+        pd.testing.assert_series_equal(scored['score'].iloc[:len(sample)], reference, check_exact=True)
+        slow *= n_wallets / len(sample)
+        estimated = '~' if len(sample) < n_wallets else ' '
+        print(f"{n_wallets:>9} {estimated}{slow:>11.3f} {fast:>11.3f} {slow / fast:>7.0f}x")
+    print("Scores identical to the row-by-row scorer (~ = reference time extrapolated from --reference-max wallets)")
+
+def scoring_rule_variants(rules, n_variants, seed=0):
+    """Copies of a rule set with every threshold, gate and point value jittered by up to 20%"""
+    rng = np.random.default_rng(seed)
+    jitter = lambda value: float(value) * rng.uniform(0.8, 1.2)
+    variants = []
+    for i in range(n_variants):
+        variant = copy.deepcopy(rules)
+        variant['name'] = f'variant_{i}'
+        for rule in variant['rules']:
+            rule['cases'] = [[op, jitter(threshold), round(jitter(points))] for op, threshold, points in rule.get('cases', [])]
+            if 'when' in rule:
+                feature, op, value = rule['when']
+                rule['when'] = [feature, op, jitter(value) if value else rng.uniform(-0.5, 0.5)]
+            if 'terms' in rule:
+                rule['terms'] = [[feature, jitter(rate), cap] for feature, rate, cap in rule['terms']]
+            if not rule['cases']:
+                del rule['cases']
+        variants.append(variant)
+    return variants
+
+def benchmark_rule_sweep(args):
+    """Batched scoring of K rule set variants vs scoring them one at a time"""
+    features = synthetic_wallet_features(args.wallets)
+    sample = features.iloc[:args.reference_max]
+    default = ScoringRuleSets([DEFAULT_SCORING_RULES]).score(sample)[0]
+    np.testing.assert_array_equal(default, reference_calculate_risk_scores(sample).to_numpy())
+    print(f"Default rule set: identical to the row-by-row scorer ({len(sample)} wallets)")
+
+    print(f"Rule sweep: {len(features)} wallets")
+    print(f"{'variants':>9} {'one by one s':>13} {'batched s':>10} {'speedup':>8} {'variants/s':>11}")
+    for n_variants in args.variants:
+        variants = scoring_rule_variants(DEFAULT_SCORING_RULES, n_variants)
+        rule_sets, compile_seconds = timed(ScoringRuleSets, variants)
+        batched, seconds = timed(rule_sets.score, features)
+        seconds += compile_seconds
+        # The one-by-one baseline is timed on at most 10 variants and extrapolated
+        started = time.perf_counter()
+        for k, variant in enumerate(variants[:10]):
+            np.testing.assert_array_equal(ScoringRuleSets([variant]).score(features)[0], batched[k])
+        one_by_one = (time.perf_counter() - started) * n_variants / min(10, n_variants)
+        print(f"{n_variants:>9} {one_by_one:>13.3f} {seconds:>10.3f} {one_by_one / seconds:>7.1f}x "
+              f"{n_variants / seconds:>11.0f}")
+
+# Top-level keys of an Aave V2 transaction export record
+AAVE_RECORD_KEYS = ['_id', 'userWallet', 'network', 'protocol', 'txHash', 'logId', 'timestamp', 'blockNumber',
+                    'action', 'actionData', '__v', 'createdAt', 'updatedAt']
+
+def reference_engineer_aave_features(path):
+    """The original score_wallet.py loader and per-group apply features, kept as the equivalence baseline"""
+    import json
+    with open(path, 'r') as f:
+        df = pd.DataFrame(json.load(f))
+
+    def normalize_amount(row):
+        try:
+            amount = int(row['actionData']['amount'])
+            asset_symbol = row['actionData']['assetSymbol']
+            decimals = 6 if asset_symbol in ['USDC'] else 18
+            price_usd = float(row['actionData']['assetPriceUSD'])
+            return (amount / 10**decimals) * price_usd
+        except (KeyError, ValueError, TypeError):
+            return 0.0
+
+    df['amount_usd'] = df.apply(normalize_amount, axis=1)
+    grouped = df.groupby('userWallet')
+    usd = lambda x, action: x[x['action'] == action]['amount_usd'].sum()
+    features = pd.DataFrame({
+        'num_deposits': grouped.apply(lambda x: (x['action'] == 'deposit').sum(), include_groups=False),
+        'num_borrows': grouped.apply(lambda x: (x['action'] == 'borrow').sum(), include_groups=False),
+        'num_repays': grouped.apply(lambda x: (x['action'] == 'repay').sum(), include_groups=False),
+        'num_redeems': grouped.apply(lambda x: (x['action'] == 'redeemunderlying').sum(), include_groups=False),
+        'num_liquidations': grouped.apply(lambda x: (x['action'] == 'liquidationcall').sum(), include_groups=False),
+        'total_transactions': grouped.size(),
+        'total_deposit_usd': grouped.apply(lambda x: usd(x, 'deposit'), include_groups=False),
+        'total_borrow_usd': grouped.apply(lambda x: usd(x, 'borrow'), include_groups=False),
+        'total_repay_usd': grouped.apply(lambda x: usd(x, 'repay'), include_groups=False),
+        'total_redeem_usd': grouped.apply(lambda x: usd(x, 'redeemunderlying'), include_groups=False),
+        'net_borrow_usd': grouped.apply(lambda x: usd(x, 'borrow') - usd(x, 'repay'), include_groups=False),
+        'repay_to_borrow_ratio': grouped.apply(lambda x: usd(x, 'repay') / usd(x, 'borrow') if usd(x, 'borrow') > 0 else 0,
+                                               include_groups=False),
+        'borrow_to_deposit_ratio': grouped.apply(lambda x: usd(x, 'borrow') / usd(x, 'deposit') if usd(x, 'deposit') > 0 else 0,
+                                                 include_groups=False),
+        'redeem_to_deposit_ratio': grouped.apply(lambda x: usd(x, 'redeemunderlying') / usd(x, 'deposit') if usd(x, 'deposit') > 0 else 0,
+                                                 include_groups=False),
+        'has_liquidation': grouped.apply(lambda x: (x['action'] == 'liquidationcall').any().astype(int), include_groups=False),
+        'liquidation_to_total_ratio': grouped.apply(lambda x: (x['action'] == 'liquidationcall').sum() / x.size if x.size > 0 else 0, include_groups=False),
+        'wallet_age_days': grouped['timestamp'].apply(lambda x: (x.max() - x.min()) / (24 * 3600)),
+        'tx_frequency': grouped.apply(lambda x: x.size / ((x['timestamp'].max() - x['timestamp'].min()) / (24 * 3600)) if (x['timestamp'].max() - x['timestamp'].min()) > 0 else 0, include_groups=False),
+        'num_unique_assets': grouped['actionData'].apply(lambda x: x.apply(lambda y: y['assetSymbol']).nunique()),
+        'avg_transaction_usd': grouped['amount_usd'].mean()
+    }).fillna(0)
+    return features.reset_index()
+
+def synthetic_aave_records(n_wallets, mean_transactions=20, seed=0):
+    """Records shaped like the Aave V2 export; logId is left out of some, as in real exports"""
+    rng = np.random.default_rng(seed)
+    per_wallet = rng.poisson(mean_transactions, n_wallets) + 1
+    actions = rng.choice(['deposit', 'borrow', 'repay', 'redeemunderlying', 'liquidationcall'],
+                         int(per_wallet.sum()), p=[0.4, 0.2, 0.18, 0.2, 0.02])
+    assets = rng.choice(['USDC', 'WETH', 'DAI', 'WMATIC'], len(actions))
+    records = []
+    for i, (wallet, action, asset) in enumerate(zip(np.repeat(np.arange(n_wallets), per_wallet), actions, assets)):
+        decimals = 6 if asset == 'USDC' else 18
+        record = {
+            '_id': {'$oid': '%024x' % i},
+            'userWallet': '0x%040x' % (wallet + 1),
+            'network': 'polygon',
+            'protocol': 'aave_v2',
+            'txHash': '0x%064x' % i,
+            'logId': f'0x{i:064x}_{i % 7}',
+            'timestamp': int(rng.integers(1_617_000_000, 1_630_000_000)),
+            'blockNumber': int(rng.integers(12_000_000, 18_000_000)),
+            'action': str(action),
+            'actionData': {'type': action.capitalize(), 'amount': str(int(rng.integers(1, 10 ** 6)) * 10 ** (decimals - 2)),
+                           'assetSymbol': str(asset), 'assetPriceUSD': repr(float(rng.lognormal(0, 1)))},
+            '__v': 0,
+            'createdAt': {'$date': '2025-03-16T05:15:21.000Z'},
+            'updatedAt': {'$date': '2025-03-16T05:15:21.000Z'},
+        }
+        if rng.random() < 0.1:
+            del record['logId']
+        records.append(record)
+    return records
+
+def check_aave_feature_equivalence(path, chunk_rows, label):
+    """score_wallet.py's streaming features against the original implementation on one export;
+    USD amounts are parsed as floats rather than Python ints, so sums match up to float rounding"""
+    import score_wallet
+    record_keys = set()
+    features = score_wallet.engineer_features_from_chunks(
+        score_wallet.iter_transaction_chunks(path, chunk_rows, record_keys), record_keys)
+    reference = reference_engineer_aave_features(path)
+    pd.testing.assert_frame_equal(features, reference, check_dtype=False, check_exact=False, rtol=1e-9)
+    print(f"{label}: matches the original implementation ({len(features)} wallets)")
+
+def benchmark_aave_features(args):
+    """score_wallet.py feature equivalence with the original implementation, then timings"""
+    import json
+    import score_wallet
+    if args.input:
+        check_aave_feature_equivalence(args.input, args.chunk_rows, args.input)
+
+    print(f"{'wallets':>9} {'txs':>10} {'reference s':>12} {'streaming s':>12} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_wallets in args.sizes:
+            path = f'{tmp}/transactions.json'
+            records = synthetic_aave_records(n_wallets, args.mean_transactions)
+            n_transactions = len(records)
+            with open(path, 'w') as f:
+                json.dump(records, f)
+            del records
+            _, fast = timed(score_wallet.engineer_features_from_chunks,
+                            score_wallet.iter_transaction_chunks(path, args.chunk_rows, set()), AAVE_RECORD_KEYS)
+            if n_wallets <= args.reference_max:
+                check_aave_feature_equivalence(path, args.chunk_rows, f"  synthetic {n_wallets}")
+                _, slow = timed(reference_engineer_aave_features, path)
+                print(f"{n_wallets:>9} {n_transactions:>10} {slow:>12.3f} {fast:>12.3f} {slow / fast:>7.1f}x")
+            else:
+                print(f"{n_wallets:>9} {n_transactions:>10} {'-':>12} {fast:>12.3f} {'-':>8}")
+
+def synthetic_aave_features(n_wallets, seed=0, chunk_wallets=1000000):
+    """score_wallet.py feature table derived from a synthetic per-wallet state, built in chunks"""
+    import score_wallet
+    rng = np.random.default_rng(seed)
+    parts = []
+    for offset in range(0, n_wallets, chunk_wallets):
+        n = min(chunk_wallets, n_wallets - offset)
+        activity = rng.lognormal(1.0, 1.2, n)
+        state = {}
+        for action, rate in zip(score_wallet.ACTIONS, [1.0, 0.5, 0.4, 0.6, 0.02]):
+            counts = rng.poisson(activity * rate)
+            state[f'count_{action}'] = counts
+            state[f'usd_{action}'] = counts * rng.lognormal(7, 2, n)
+        # Integer wallet ids keep tens of millions of wallets within memory; clustering ignores them
+        state = pd.DataFrame(state, index=pd.RangeIndex(offset, offset + n, name='userWallet'))
+        state['count_deposit'] += (state[score_wallet.STATE_COUNT_COLUMNS].sum(axis=1) == 0)
+        state['total_transactions'] = state[score_wallet.STATE_COUNT_COLUMNS].sum(axis=1)
+        state['total_usd'] = state[score_wallet.STATE_USD_COLUMNS].sum(axis=1)
+        state['first_timestamp'] = rng.integers(1_600_000_000, 1_620_000_000, n)
+        state['last_timestamp'] = state['first_timestamp'] + (state['total_transactions'] > 1) * rng.integers(0, 10 ** 7, n)
+        for asset in ['USDC', 'WETH', 'DAI']:
+            state[score_wallet.ASSET_PREFIX + asset] = rng.random(n) < 0.5
+        parts.append(score_wallet.features_from_state(state, score_wallet.record_width(AAVE_RECORD_KEYS)))
+    return pd.concat(parts, ignore_index=True)
+
+def traced(function, *args, **kwargs):
+    """timed() plus the peak memory traced while function runs, in MB"""
+    tracemalloc.start()
+    try:
+        result, seconds = timed(function, *args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+def benchmark_clustering(args):
+    """Mini-batch vs full-batch clustering: time, traced peak memory and cluster quality"""
+    import score_wallet
+    print(f"{'wallets':>9} {'feat MB':>8} {'minibatch s':>12} {'peak MB':>8} {'full s':>8} {'peak MB':>8} "
+          f"{'inertia':>8} {'ARI':>6} {'seed ARI':>9}")
+    for n_wallets in args.sizes:
+        features = synthetic_aave_features(n_wallets)
+        minibatch, fast, fast_peak = traced(score_wallet.cluster_wallets, features.copy(deep=False),
+                                            minibatch=True, chunk_rows=args.chunk_rows)
+        if n_wallets <= args.baseline_max:
+            (_, labels), slow, slow_peak = traced(score_wallet.WalletModel.fit, features)
+            quality = score_wallet.compare_to_full_batch(features, minibatch[1], args.chunk_rows)
+            # How much two equally good full-batch fits already disagree on this data
+            X_scaled = StandardScaler().fit_transform(features.drop(columns=['userWallet']))
+            seed_ari = adjusted_rand_score(labels, KMeans(n_clusters=score_wallet.N_CLUSTERS,
+                                                          random_state=0).fit_predict(X_scaled))
+            print(f"{n_wallets:>9} {memory_mb(features):>8.0f} {fast:>12.2f} {fast_peak:>8.0f} {slow:>8.2f} "
+                  f"{slow_peak:>8.0f} {quality['inertia'] / quality['baseline_inertia'] - 1:>+8.2%} "
+                  f"{quality['adjusted_rand_index']:>6.3f} {seed_ari:>9.3f}")
+        else:
+            print(f"{n_wallets:>9} {memory_mb(features):>8.0f} {fast:>12.2f} {fast_peak:>8.0f} {'-':>8} {'-':>8} "
+                  f"{'-':>8} {'-':>6} {'-':>9}")
+    print("inertia: mini-batch relative to full-batch KMeans; ARI: adjusted Rand index of the two clusterings; "
+          "seed ARI: full-batch KMeans vs itself with another seed")
+
+def synthetic_store_frame(df, seed=0):
+    """Add the columns the raw store needs to a synthetic feature frame"""
+    rng = np.random.default_rng(seed)
+    n = len(df)
+    return df.assign(contract_address='', value_eth=0.0, gas_price=rng.integers(1, 200, n) * 10 ** 9,
+                     tx_hash=['0x%064x' % i for i in range(n)], block_number=rng.integers(7_000_000, 20_000_000, n))
+
+def benchmark_parallel_features(args):
+    """Process-pool feature engineering from the raw store per worker count"""
+    df, wallets = synthetic_compound_transactions(args.wallets, args.mean_transactions)
+    print(f"Parallel features: {len(wallets)} wallets, {len(df)} transactions, {os.cpu_count()} CPU core(s); "
+          f"worker counts above that run as {os.cpu_count()}")
+    reference = engineer_compound_features(df, wallets)
+    with tempfile.TemporaryDirectory() as root:
+        store = RawTransactionStore(root)
+        with store:
+            store.write(synthetic_store_frame(df))
+        baseline = None
+        print(f"{'workers':>8} {'store s':>9} {'speedup':>8}")
+        for workers in args.workers:
+            features, seconds = timed(engineer_compound_features_from_store, store, wallets, max_workers=workers)
+            # Partitioning must not change a single value or the row order
+            check_feature_equivalence(features, reference, f"  {workers} workers", "the in-memory features")
+            baseline = baseline or seconds
+            print(f"{workers:>8} {seconds:>9.3f} {baseline / seconds:>7.1f}x")
+
+def benchmark_memory(args):
+    """Memory of raw and feature frames in their plain and compact representations"""
+    df, wallets = synthetic_compound_transactions(args.wallets, args.mean_transactions)
+    rows = []
+    with tempfile.TemporaryDirectory() as root:
+        csv_path = f"{root}/raw.csv"
+        synthetic_store_frame(df).to_csv(csv_path, index=False)
+        plain = pd.read_csv(csv_path, usecols=FEATURE_SOURCE_COLUMNS)
+        typed = pd.read_csv(csv_path, usecols=FEATURE_SOURCE_COLUMNS, dtype=FEATURE_SOURCE_DTYPES)
+        store = RawTransactionStore(f"{root}/store")
+        with store:
+            store.write(synthetic_store_frame(df))
+        rows.append(('raw (csv)', memory_mb(plain), memory_mb(typed)))
+        rows.append(('raw (store)', memory_mb(plain), memory_mb(store.read_frame(FEATURE_SOURCE_COLUMNS))))
+
+    features = engineer_compound_features(df, wallets)
+    rows.append(('features', memory_mb(features), memory_mb(compact_features(features))))
+    rows.append(('features float32', memory_mb(features), memory_mb(compact_features(features, float32=True))))
+
+    print(f"Memory: {len(wallets)} wallets, {len(df)} transactions")
+    print(f"{'frame':>18} {'plain MB':>9} {'compact MB':>11} {'ratio':>6}")
+    for label, before, after in rows:
+        print(f"{label:>18} {before:>9.1f} {after:>11.1f} {before / after:>5.1f}x")
+
+def benchmark_windows(args):
+    """Cost of activity window features as the number of windows grows"""
+    df, wallets = synthetic_compound_transactions(args.wallets, args.mean_transactions)
+    df = synthetic_store_frame(df).assign(value_eth=np.random.default_rng(1).random(len(df)))
+    as_of = int(df['timestamp'].max())
+    print(f"Activity windows: {len(wallets)} wallets, {len(df)} transactions")
+    print(f"{'windows':>8} {'columns':>8} {'seconds':>8}")
+    for n_windows in args.windows:
+        windows = [7 * 2 ** i for i in range(n_windows)]
+        features, seconds = timed(window_features_from_chunks, [df], wallets, as_of, windows)
+        print(f"{n_windows:>8} {features.shape[1] - 1:>8} {seconds:>8.3f}")
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the wallet scoring pipeline")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    collection = subparsers.add_parser('collection', help="Collector throughput against replay_server.py")
+    collection.add_argument('--wallets', type=int, default=200)
+    collection.add_argument('--workers', type=parse_int_list, default=[1, 4, 16],
+                            help="Comma-separated worker counts to compare")
+    collection.add_argument('--latency', type=float, default=0.1)
+    collection.add_argument('--error-rate', type=float, default=0.0)
+    collection.add_argument('--requests-per-second', type=float, default=50)
+    collection.add_argument('--keys', type=int, default=1)
+    collection.add_argument('--mean-transactions', type=float, default=50)
+    collection.add_argument('--heavy-fraction', type=float, default=0.0)
+    collection.add_argument('--fixtures', help="Replay recorded fixtures instead of synthetic wallets")
+    collection.set_defaults(run=benchmark_collection)
+
+    features = subparsers.add_parser('features', help="Feature engineering equivalence and speed")
+    features.add_argument('--raw', default=RAW_TRANSACTIONS_FILE, help="Raw transactions CSV for the equivalence check")
+    features.add_argument('--wallet-file', default='Wallet.csv')
+    features.add_argument('--sizes', type=parse_int_list, default=[1000, 10000, 100000],
+                          help="Comma-separated synthetic wallet counts")
+    features.add_argument('--mean-transactions', type=float, default=20)
+    features.add_argument('--reference-max', type=int, default=10000,
+                          help="Largest size the slow reference implementation is run on")
+    features.set_defaults(run=benchmark_features)
+
+    scores = subparsers.add_parser('scores', help="Columnar vs row-by-row risk scoring equivalence and speed")
+    scores.add_argument('--sizes', type=parse_int_list, default=[10000, 1000000, 10000000],
+                        help="Comma-separated synthetic wallet counts")
+    scores.add_argument('--reference-max', type=int, default=100000,
+                        help="Wallets the slow reference scorer is run on per size")
+    scores.set_defaults(run=benchmark_scores)
+
+    sweep = subparsers.add_parser('rule-sweep', help="Batched scoring of many rule set variants")
+    sweep.add_argument('--wallets', type=int, default=100000)
+    sweep.add_argument('--variants', type=parse_int_list, default=[1, 10, 100, 500],
+                       help="Comma-separated numbers of rule set variants to score together")
+    sweep.add_argument('--reference-max', type=int, default=10000,
+                       help="Wallets the default rule set is checked against the row-by-row scorer on")
+    sweep.set_defaults(run=benchmark_rule_sweep)
+
+    aave = subparsers.add_parser('aave-features', help="score_wallet.py feature equivalence with the original and speed")
+    aave.add_argument('--input', help="Also check equivalence on this JSON array export")
+    aave.add_argument('--sizes', type=parse_int_list, default=[1000, 10000, 50000],
+                      help="Comma-separated synthetic wallet counts")
+    aave.add_argument('--mean-transactions', type=float, default=20)
+    aave.add_argument('--chunk-rows', type=int, default=100000)
+    aave.add_argument('--reference-max', type=int, default=1000,
+                      help="Largest size the slow reference implementation is run on")
+    aave.set_defaults(run=benchmark_aave_features)
+
+    clustering = subparsers.add_parser('clustering', help="score_wallet.py mini-batch vs full-batch clustering")
+    clustering.add_argument('--sizes', type=parse_int_list, default=[100000, 1000000, 10000000],
+                            help="Comma-separated synthetic wallet counts")
+    clustering.add_argument('--chunk-rows', type=int, default=100000)
+    clustering.add_argument('--baseline-max', type=int, default=1000000,
+                            help="Largest size full-batch KMeans is run on for comparison")
+    clustering.set_defaults(run=benchmark_clustering)
+
+    parallel = subparsers.add_parser('parallel-features', help="Process-pool feature engineering speedup")
+    parallel.add_argument('--wallets', type=int, default=200000)
+    parallel.add_argument('--mean-transactions', type=float, default=20)
+    parallel.add_argument('--workers', type=parse_int_list, default=[1, 2, 4, 8],
+                          help="Comma-separated worker counts to compare; the first is the baseline")
+    parallel.set_defaults(run=benchmark_parallel_features)
+
+    windows = subparsers.add_parser('windows', help="Activity window features vs number of windows")
+    windows.add_argument('--wallets', type=int, default=100000)
+    windows.add_argument('--mean-transactions', type=float, default=20)
+    windows.add_argument('--windows', type=parse_int_list, default=[1, 3, 10],
+                         help="Comma-separated window counts to compare")
+    windows.set_defaults(run=benchmark_windows)
+
+    memory = subparsers.add_parser('memory', help="Memory of plain vs compact raw and feature frames")
+    memory.add_argument('--wallets', type=int, default=100000)
+    memory.add_argument('--mean-transactions', type=float, default=20)
+    memory.set_defaults(run=benchmark_memory)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,19 @@
 import pandas as pd
+import csv
 import json
+import glob
+import shutil
+import zlib
 import requests
+from requests.adapters import HTTPAdapter
+import random
 import time
+import os
+import threading
+import itertools
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 import numpy as np
 from sklearn.preprocessing import StandardScaler
@@ -51,163 +63,1280 @@ COMPOUND_V3_FUNCTIONS = {
     'repay': '0x1ededc91'         # Different signature for V3
 }
 
-def load_wallet_addresses(csv_file_path):
-    """Load wallet addresses from CSV file"""
-    try:
-        # Try different possible column names
-        df = pd.read_csv(csv_file_path)
-        
-        wallet_column = 'wallet_id'
+# Selector -> action, per protocol version
+V2_SELECTOR_ACTIONS = {
+    COMPOUND_V2_FUNCTIONS['mint']: 'supply',  # mint = supply in V2
+    COMPOUND_V2_FUNCTIONS['redeem']: 'redeem',
+    COMPOUND_V2_FUNCTIONS['redeemUnderlying']: 'redeem',
+    COMPOUND_V2_FUNCTIONS['borrow']: 'borrow',
+    COMPOUND_V2_FUNCTIONS['repayBorrow']: 'repay',
+    COMPOUND_V2_FUNCTIONS['repayBorrowBehalf']: 'repay',
+    COMPOUND_V2_FUNCTIONS['liquidateBorrow']: 'liquidation'
+}
+V3_SELECTOR_ACTIONS = {
+    COMPOUND_V3_FUNCTIONS['supply']: 'supply',
+    COMPOUND_V3_FUNCTIONS['withdraw']: 'withdraw',
+    COMPOUND_V3_FUNCTIONS['borrow']: 'borrow',
+    COMPOUND_V3_FUNCTIONS['repay']: 'repay'
+}
+COMPOUND_V3_ADDRESSES = {addr.lower() for addr in COMPOUND_V3_CONTRACTS.values()}
+
+def build_compound_dispatch():
+    """Map (lowercased contract, 4-byte selector) to (action, contract_name, version)"""
+    dispatch = {}
+    for version, contracts, selectors in (('v2', COMPOUND_V2_CONTRACTS, V2_SELECTOR_ACTIONS),
+                                          ('v3', COMPOUND_V3_CONTRACTS, V3_SELECTOR_ACTIONS)):
+        for name, address in contracts.items():
+            for selector, action in selectors.items():
+                dispatch[(address.lower(), selector)] = (action, name, version)
+    return dispatch
+
+# Built once at import; every filter path looks transactions up here
+COMPOUND_DISPATCH = build_compound_dispatch()
+# Columnar copy for the batch filter: key index -> action / contract_name arrays
+_DISPATCH_INDEX = pd.Index([to + selector for to, selector in COMPOUND_DISPATCH])
+_DISPATCH_ACTIONS = np.array([entry[0] for entry in COMPOUND_DISPATCH.values()], dtype=object)
+_DISPATCH_NAMES = np.array([entry[1] for entry in COMPOUND_DISPATCH.values()], dtype=object)
+
+# Category vocabularies for the columnar raw-transaction store
+COMPOUND_ACTIONS = ['supply', 'withdraw', 'borrow', 'repay', 'redeem', 'liquidation']
+COMPOUND_CONTRACT_NAMES = list(ALL_COMPOUND_CONTRACTS)
+
+COMPOUND_TX_COLUMNS = ['userWallet', 'timestamp', 'action', 'contract_address', 'contract_name',
+                       'value_eth', 'gas_used', 'gas_price', 'tx_hash', 'block_number', 'is_error']
+
+# Etherscan free-tier budget; collection never exceeds this across all workers
+ETHERSCAN_API_URL = "https://api.etherscan.io/api"
+ETHERSCAN_REQUESTS_PER_SECOND = 5
+DEFAULT_COLLECTOR_WORKERS = 4
+ETHERSCAN_PAGE_SIZE = 10000  # Max rows per txlist request (page * offset <= 10000)
+LATEST_BLOCK = 99999999
+MAX_REQUEST_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30
+SINK_BATCH_ROWS = 50000  # rows buffered before a sink writes a chunk
+RAW_TRANSACTIONS_FILE = 'compound_transactions_raw.csv'
+RAW_STORE_DIR = 'raw_store'
+RAW_STORE_PARTITIONS = 16
+CHECKPOINT_FILE = 'collection_checkpoint.jsonl'
+FAILED_WALLETS_FILE = 'failed_wallets.csv'
+
+WALLET_ADDRESS_PATTERN = r'0x[0-9a-f]{40}'
+WALLET_COLUMN = 'wallet_id'
+WALLET_CHUNK_ROWS = 1000000
+INVALID_WALLETS_FILE = 'invalid_wallets.csv'
+
+def iter_wallet_chunks(path, chunk_rows=WALLET_CHUNK_ROWS):
+    """Yield (line number of first row, raw addresses) chunks from a wallet_id CSV or a plain list
+    
+    A file with a wallet_id header goes through the CSV parser, so quoted fields
+    are read as CSV; a file whose first line is not such a header is read as
+    one address per line. A UTF-8 byte order mark is ignored either way.
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        header = [field.strip() for field in next(csv.reader([f.readline()]), [])]
+    if WALLET_COLUMN in header:
+        reader = pd.read_csv(path, encoding='utf-8-sig', usecols=[WALLET_COLUMN], dtype=str, chunksize=chunk_rows,
+                             keep_default_na=False, skip_blank_lines=False)
+        for chunk in reader:
+            yield chunk.index[0] + 2, chunk[WALLET_COLUMN]
+        return
+    
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        line_number = 1
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            yield line_number, pd.Series(lines, dtype=object).str.rstrip('\r\n')
+            line_number += len(lines)
+
+def load_wallet_addresses(csv_file_path, invalid_report=INVALID_WALLETS_FILE, chunk_rows=WALLET_CHUNK_ROWS):
+    """Load wallet addresses from a CSV file (or a plain list, one per line)
     
+    Addresses are stripped and lowercased, checked against 0x + 40 hex digits
+    a whole chunk at a time, and deduplicated keeping the first occurrence.
+    Rejected rows go to invalid_report instead of the console.
+    """
+    try:
+        valid, invalid = [], []
+        total_rows = 0
+        for first_line, raw in iter_wallet_chunks(csv_file_path, chunk_rows):
+            total_rows += len(raw)
+            addresses = raw.str.strip().str.lower()
+            ok = addresses.str.fullmatch(WALLET_ADDRESS_PATTERN).to_numpy(bool)
+            valid.append(addresses[ok].to_numpy(dtype=object))
+            # Blank lines are not addresses at all, so they are not reported
+            rejected = np.flatnonzero(~ok & (addresses != '').to_numpy(bool))
+            if len(rejected):
+                invalid.append(pd.DataFrame({
+                    'line': first_line + rejected,
+                    'value': raw.iloc[rejected].to_numpy(dtype=object),
+                    'reason': np.where(addresses.iloc[rejected].str.len() == 42, 'not hex', 'not 42 characters'),
+                }))
         
-        # Extract wallet addresses and clean them
-        wallet_addresses = df[wallet_column].astype(str).str.strip().str.lower()
+        addresses = np.concatenate(valid) if valid else np.array([], dtype=object)
+        # pd.unique keeps the order of first appearance
+        wallet_addresses = list(pd.unique(addresses))
         
-        # Filter out any invalid addresses (should start with 0x and be 42 characters)
-        valid_addresses = []
-        for addr in wallet_addresses:
-            if addr.startswith('0x') and len(addr) == 42:
-                valid_addresses.append(addr)
-            else:
-                print(f"Skipping invalid address: {addr}")
+        invalid = pd.concat(invalid, ignore_index=True) if invalid else pd.DataFrame(columns=['line', 'value', 'reason'])
+        if not invalid.empty:
+            invalid.to_csv(invalid_report, index=False)
+            print(f"Skipped {len(invalid)} invalid address(es); see {invalid_report}")
+        elif os.path.exists(invalid_report):
+            os.remove(invalid_report)  # stale report from an earlier run
+        duplicates = len(addresses) - len(wallet_addresses)
+        if duplicates:
+            print(f"Dropped {duplicates} duplicate address(es)")
         
-        print(f"Loaded {len(valid_addresses)} valid wallet addresses from {csv_file_path}")
-        return valid_addresses
+        print(f"Loaded {len(wallet_addresses)} valid wallet addresses from {csv_file_path}")
+        return wallet_addresses
         
     except Exception as e:
         print(f"Error loading wallet addresses from CSV: {e}")
         return []
 
+class TokenBucket:
+    """Thread-safe token bucket shared by every request the collector makes"""
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)          # tokens added per second
+        self.capacity = float(capacity)  # burst size; 1 keeps requests evenly spaced
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def try_acquire(self, tokens=1):
+        """Consume `tokens` if available; returns 0, or the seconds until they will be"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+    
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available, then consume them"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+class AdaptiveRateLimiter(TokenBucket):
+    """Token bucket whose rate follows AIMD: +step per success, x factor on throttling"""
+    def __init__(self, max_rate, min_rate=0.5, increase_step=0.05, decrease_factor=0.5, capacity=1):
+        super().__init__(max_rate, capacity)
+        self.max_rate = float(max_rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+    
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+    
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+
+class EtherscanAPIError(Exception):
+    """Raised when a txlist request fails for good (bad key, bad params, retries exhausted)"""
+
+def is_rate_limited(data):
+    """Whether an Etherscan JSON payload is a throttling response"""
+    return 'rate limit' in str(data.get('result', '')).lower()
+
+def is_invalid_key(data):
+    """Whether an Etherscan JSON payload rejects the API key itself"""
+    return 'invalid api key' in str(data.get('result', '')).lower()
+
+class ApiKey:
+    """One API key with its own rate budget and health counters"""
+    def __init__(self, key, requests_per_second):
+        self.key = key
+        self.limiter = AdaptiveRateLimiter(requests_per_second)
+        self.revoked = False
+        self.consecutive_throttles = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+    
+    def __repr__(self):
+        label = f"{self.key[:6]}..." if self.key else "<no key>"
+        return f"ApiKey({label})"
+
+class ApiKeyPool:
+    """Spreads requests over several API keys so throughput scales with the number of keys"""
+    def __init__(self, keys, requests_per_second=ETHERSCAN_REQUESTS_PER_SECOND,
+                 max_consecutive_throttles=3, cooldown_seconds=60):
+        # keys: a single key, a list of keys, or {key: requests_per_second}
+        if keys is None or isinstance(keys, str):
+            keys = [keys]
+        if not isinstance(keys, dict):
+            keys = {key: requests_per_second for key in keys}
+        self.keys = [ApiKey(key, rps) for key, rps in keys.items()]
+        self.max_consecutive_throttles = max_consecutive_throttles
+        self.cooldown_seconds = cooldown_seconds
+        self.lock = threading.Lock()
+        self.next_index = 0
+    
+    def active_keys(self):
+        now = time.monotonic()
+        return [k for k in self.keys if not k.revoked and k.cooldown_until <= now]
+    
+    def acquire(self):
+        """Block until some healthy key has budget left, and return it"""
+        while True:
+            with self.lock:
+                active = self.active_keys()
+                if not active:
+                    cooling = [k.cooldown_until for k in self.keys if not k.revoked]
+                    if not cooling:
+                        raise EtherscanAPIError("No healthy API keys left in the pool")
+                    wait = max(0.0, min(cooling) - time.monotonic())
+                else:
+                    # Round-robin start so keys with equal budgets share the load
+                    start = self.next_index % len(active)
+                    self.next_index += 1
+                    wait = None
+                    for key in active[start:] + active[:start]:
+                        key_wait = key.limiter.try_acquire()
+                        if not key_wait:
+                            key.requests += 1
+                            return key
+                        wait = key_wait if wait is None else min(wait, key_wait)
+            time.sleep(wait)
+    
+    def report_success(self, key):
+        key.consecutive_throttles = 0
+        key.limiter.on_success()
+    
+    def report_throttle(self, key):
+        key.limiter.on_throttle()
+        with self.lock:
+            key.consecutive_throttles += 1
+            if key.consecutive_throttles >= self.max_consecutive_throttles:
+                # Rest a key that keeps getting throttled; the others carry on
+                key.cooldown_until = time.monotonic() + self.cooldown_seconds
+                key.consecutive_throttles = 0
+                print(f"{key} throttled repeatedly; cooling down for {self.cooldown_seconds}s")
+    
+    def report_revoked(self, key):
+        with self.lock:
+            if not key.revoked:
+                key.revoked = True
+                print(f"{key} rejected by the API; removed from rotation")
+    
+    def summary(self):
+        """Per-key request counts and health, for the end-of-run report"""
+        return [{'key': repr(k), 'requests': k.requests, 'revoked': k.revoked,
+                 'rate': round(k.limiter.rate, 2)} for k in self.keys]
+
+def parse_api_keys(value, default_rate=ETHERSCAN_REQUESTS_PER_SECOND):
+    """Parse 'key1,key2:10' into {key: requests_per_second}"""
+    keys = {}
+    for entry in (value or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        key, _, rate = entry.partition(':')
+        keys[key] = float(rate) if rate else default_rate
+    return keys
+
+class TransactionCache:
+    """On-disk cache of raw txlist rows per wallet, with a block high-water mark"""
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def _paths(self, wallet):
+        base = os.path.join(self.cache_dir, wallet.lower())
+        return base + '.jsonl', base + '.meta.json'
+    
+    def _read_meta(self, wallet):
+        _, meta_path = self._paths(wallet)
+        try:
+            with open(meta_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {'last_block': None, 'size': 0}
+    
+    def last_block(self, wallet):
+        """Highest block already cached for a wallet, or None"""
+        return self._read_meta(wallet)['last_block']
+    
+    def iter_pages(self, wallet, page_size=ETHERSCAN_PAGE_SIZE):
+        """Yield cached transactions in pages of at most page_size rows"""
+        rows_path, _ = self._paths(wallet)
+        size = self._read_meta(wallet)['size']
+        if not size:
+            return
+        page, offset = [], 0
+        with open(rows_path, 'rb') as f:
+            for line in f:
+                # Only trust bytes covered by the meta file; anything after it is a torn write
+                offset += len(line)
+                if offset > size:
+                    break
+                page.append(json.loads(line))
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+    
+    def append(self, wallet, page):
+        """Append a page of transactions and advance the wallet's high-water mark"""
+        if not page:
+            return
+        rows_path, meta_path = self._paths(wallet)
+        meta = self._read_meta(wallet)
+        with open(rows_path, 'ab') as f:
+            f.truncate(meta['size'])
+            for tx in page:
+                f.write(json.dumps(tx).encode() + b'\n')
+            size = f.tell()
+        last_block = max(int(tx['blockNumber']) for tx in page)
+        if meta['last_block'] is not None:
+            last_block = max(last_block, meta['last_block'])
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_block': last_block, 'size': size}, f)
+        os.replace(tmp_path, meta_path)
+
+class CsvTransactionSink:
+    """Append-only CSV sink for filtered transaction batches"""
+    def __init__(self, path, append=False):
+        self.path = path
+        self.buffer = []
+        self.buffered_rows = 0
+        # Only write a header when starting a new file
+        self.header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        if self.header and os.path.exists(path):
+            os.remove(path)
+    
+    def write(self, frame):
+        self.buffer.append(frame)
+        self.buffered_rows += len(frame)
+    
+    def position(self):
+        """Bytes on disk so far; rollback(position) drops anything written after it"""
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+    
+    def rollback(self, position):
+        """Truncate rows flushed after `position`, e.g. by a run that crashed before checkpointing them"""
+        if self.position() > position:
+            with open(self.path, 'ab') as f:
+                f.truncate(position)
+        self.header = position == 0
+    
+    def flush(self):
+        """Append buffered batches to disk as one chunk"""
+        if not self.buffer:
+            return
+        chunk = pd.concat(self.buffer, ignore_index=True)
+        chunk.to_csv(self.path, mode='w' if self.header else 'a', header=self.header, index=False)
+        self.header = False
+        self.buffer = []
+        self.buffered_rows = 0
+    
+    def close(self):
+        self.flush()
+        if self.header:
+            # No rows at all: still leave a readable, header-only file
+            pd.DataFrame(columns=COMPOUND_TX_COLUMNS).to_csv(self.path, index=False)
+            self.header = False
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def wallet_shards(wallets, n_shards):
+    """Stable shard number (crc32 of the lowercased address) for each wallet"""
+    codes, uniques = pd.factorize(pd.Series(wallets, dtype=object).str.lower())
+    shards = np.array([zlib.crc32(w.encode()) % n_shards for w in uniques], dtype=np.int64)
+    return shards[codes]
+
+def _encode_hex(values, width):
+    """'0x…' strings to fixed-width bytes (width = bytes per value)"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    encoded = np.array([bytes.fromhex(v[2:]) for v in uniques], dtype=f'S{width}')
+    return encoded[codes]
+
+def raw_fingerprint(hash_chunks):
+    """Row count and an order-independent checksum of S32 tx hash arrays
+    
+    Changes when rows are added or removed, but not when the same rows are
+    rewritten in a different order or chunk layout by a fresh collection run.
+    """
+    rows, checksum = 0, 0
+    for hashes in hash_chunks:
+        rows += len(hashes)
+        checksum = (checksum + int(np.ascontiguousarray(hashes).view(np.uint64).sum(dtype=np.uint64))) % 2 ** 64
+    return f'{rows}:{checksum}'
+
+def _decode_hex(values, width):
+    # NumPy strips trailing NUL bytes from S-dtype items, so pad them back
+    return np.array(['0x' + v.ljust(width, b'\0').hex() for v in values], dtype=object)
+
+class RawTransactionStore:
+    """Columnar, typed store for filtered Compound transactions
+    
+    Rows are partitioned by a hash of the wallet; each flush writes one chunk
+    directory per partition holding one .npy file per column:
+    
+        <root>/part-07/chunk-000003/timestamp.npy
+    
+    Wallets and hashes are raw bytes (S20/S32), action and contract are int8
+    codes into fixed vocabularies, timestamps/blocks/gas are unsigned ints and
+    is_error is bit-packed. Readers memory-map only the columns they ask for,
+    and only the partitions holding the wallets they ask for.
+    """
+    COLUMN_DTYPES = {
+        'userWallet': 'S20',
+        'timestamp': np.uint32,
+        'action': np.int8,
+        'contract_name': np.int8,
+        'value_eth': np.float64,
+        'gas_used': np.uint32,
+        'gas_price': np.uint64,
+        'tx_hash': 'S32',
+        'block_number': np.uint32,
+        'is_error': np.uint8,  # np.packbits of the boolean column
+    }
+    
+    def __init__(self, root, n_partitions=RAW_STORE_PARTITIONS):
+        self.root = root
+        meta_path = os.path.join(root, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta['actions'] != COMPOUND_ACTIONS or meta['contracts'] != COMPOUND_CONTRACT_NAMES:
+                raise ValueError(f"{root} was written with different action/contract vocabularies")
+            n_partitions = meta['n_partitions']
+        else:
+            os.makedirs(root, exist_ok=True)
+            with open(meta_path, 'w') as f:
+                json.dump({'version': 1, 'n_partitions': n_partitions,
+                           'actions': COMPOUND_ACTIONS, 'contracts': COMPOUND_CONTRACT_NAMES}, f, indent=2)
+        self.n_partitions = n_partitions
+        self.buffer = []
+        self.buffered_rows = 0
+        self.next_chunk = 1 + max((int(path.rsplit('-', 1)[1]) for path in self._chunk_dirs()), default=0)
+    
+    def _chunk_dirs(self, partitions=None):
+        partitions = range(self.n_partitions) if partitions is None else partitions
+        dirs = []
+        for partition in partitions:
+            dirs.extend(sorted(glob.glob(os.path.join(self.root, f'part-{partition:02d}', 'chunk-[0-9]*[0-9]'))))
+        return dirs
+    
+    def partition_of(self, wallets):
+        """Partition number for each wallet address"""
+        return wallet_shards(wallets, self.n_partitions)
+    
+    def clear(self):
+        """Drop every stored chunk (keeps the vocabularies)"""
+        for path in glob.glob(os.path.join(self.root, 'part-*')):
+            shutil.rmtree(path)
+        self.next_chunk = 1
+    
+    def fingerprint(self):
+        """raw_fingerprint() of the stored tx hashes"""
+        return raw_fingerprint(np.load(os.path.join(chunk_dir, 'tx_hash.npy'), mmap_mode='r')
+                               for chunk_dir in self._chunk_dirs())
+    
+    # Sink interface, so collect_to_sink can stream into the store
+    def write(self, frame):
+        self.buffer.append(frame)
+        self.buffered_rows += len(frame)
+    
+    def position(self):
+        """Number of the last chunk flushed; rollback(position) drops every later chunk"""
+        return self.next_chunk - 1
+    
+    def rollback(self, position):
+        """Drop chunks flushed after `position`, including the partitions a crashed
+        flush had already written, and any half-written chunk directories"""
+        for chunk_dir in self._chunk_dirs():
+            if int(chunk_dir.rsplit('-', 1)[1]) > position:
+                shutil.rmtree(chunk_dir)
+        for tmp_dir in glob.glob(os.path.join(self.root, 'part-*', 'chunk-*.tmp')):
+            shutil.rmtree(tmp_dir)
+        self.next_chunk = position + 1
+    
+    def flush(self):
+        if not self.buffer:
+            return
+        chunk = pd.concat(self.buffer, ignore_index=True)
+        self.buffer = []
+        self.buffered_rows = 0
+        
+        columns = {
+            'userWallet': _encode_hex(chunk['userWallet'], 20),
+            'timestamp': chunk['timestamp'].to_numpy(np.uint32),
+            'action': pd.Categorical(chunk['action'], categories=COMPOUND_ACTIONS).codes.astype(np.int8),
+            'contract_name': pd.Categorical(chunk['contract_name'], categories=COMPOUND_CONTRACT_NAMES).codes.astype(np.int8),
+            'value_eth': chunk['value_eth'].to_numpy(np.float64),
+            'gas_used': chunk['gas_used'].to_numpy(np.uint32),
+            'gas_price': chunk['gas_price'].to_numpy(np.uint64),
+            'tx_hash': _encode_hex(chunk['tx_hash'], 32),
+            'block_number': chunk['block_number'].to_numpy(np.uint32),
+            'is_error': chunk['is_error'].to_numpy(bool),
+        }
+        partitions = self.partition_of(chunk['userWallet'])
+        for partition in np.unique(partitions):
+            rows = np.flatnonzero(partitions == partition)
+            final_dir = os.path.join(self.root, f'part-{partition:02d}', f'chunk-{self.next_chunk:06d}')
+            tmp_dir = final_dir + '.tmp'
+            os.makedirs(tmp_dir, exist_ok=True)
+            for name, values in columns.items():
+                values = values[rows]
+                if name == 'is_error':
+                    values = np.packbits(values)
+                np.save(os.path.join(tmp_dir, name + '.npy'), values)
+            # Readers never see a half-written chunk
+            os.replace(tmp_dir, final_dir)
+        self.next_chunk += 1
+    
+    def close(self):
+        self.flush()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def _read_chunk(self, chunk_dir, columns):
+        arrays = {}
+        n_rows = len(np.load(os.path.join(chunk_dir, 'timestamp.npy'), mmap_mode='r'))
+        for name in columns:
+            source = 'contract_name' if name == 'contract_address' else name
+            values = np.load(os.path.join(chunk_dir, source + '.npy'), mmap_mode='r')
+            if name == 'is_error':
+                values = np.unpackbits(values, count=n_rows).astype(bool)
+            arrays[name] = values
+        return arrays
+    
+    def _iter_arrays(self, columns, wallets=None, partitions=None):
+        read_columns = list(dict.fromkeys(columns + (['userWallet'] if wallets is not None else [])))
+        if wallets is not None:
+            wallet_bytes = np.unique(_encode_hex(pd.Series(wallets).str.lower(), 20))
+            wanted = set(self.partition_of(wallets))
+            partitions = sorted(wanted if partitions is None else wanted & set(partitions))
+        for chunk_dir in self._chunk_dirs(partitions):
+            arrays = self._read_chunk(chunk_dir, read_columns)
+            if wallets is not None:
+                keep = np.isin(arrays['userWallet'], wallet_bytes)
+                arrays = {name: values[keep] for name, values in arrays.items()}
+            yield arrays
+    
+    def iter_chunks(self, columns=None, wallets=None, partitions=None):
+        """Yield one decoded frame per stored chunk, optionally only for some wallets or partitions"""
+        columns = list(columns or COMPOUND_TX_COLUMNS)
+        for arrays in self._iter_arrays(columns, wallets, partitions):
+            yield self._decode(arrays, columns)
+    
+    def read_frame(self, columns=None, wallets=None):
+        """Load the requested columns (and wallets' partitions) as one typed frame"""
+        columns = list(columns or COMPOUND_TX_COLUMNS)
+        chunks = list(self._iter_arrays(columns, wallets))
+        if chunks:
+            arrays = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in columns}
+        else:
+            arrays = {name: np.array([], dtype=self.COLUMN_DTYPES.get(name, np.int8)) for name in columns}
+        return self._decode(arrays, columns)
+    
+    def _decode(self, arrays, columns):
+        frame = {}
+        for name in columns:
+            values = arrays[name]
+            if name == 'userWallet':
+                codes, uniques = pd.factorize(np.asarray(values))
+                frame[name] = pd.Categorical.from_codes(codes, categories=_decode_hex(uniques, 20)) if len(uniques) else pd.Categorical([])
+            elif name == 'tx_hash':
+                frame[name] = _decode_hex(values, 32)
+            elif name == 'action':
+                frame[name] = pd.Categorical.from_codes(np.asarray(values), categories=COMPOUND_ACTIONS)
+            elif name == 'contract_name':
+                frame[name] = pd.Categorical.from_codes(np.asarray(values), categories=COMPOUND_CONTRACT_NAMES)
+            elif name == 'contract_address':
+                addresses = [ALL_COMPOUND_CONTRACTS[c].lower() for c in COMPOUND_CONTRACT_NAMES]
+                frame[name] = pd.Categorical.from_codes(np.asarray(values), categories=addresses)
+            else:
+                frame[name] = np.asarray(values)
+        return pd.DataFrame(frame, columns=columns)
+
+class CollectionCheckpoint:
+    """Durable per-wallet progress log (JSON lines; the last record per wallet wins)
+    
+    Each batch of wallet records is followed by a {"sink_position": ...} line
+    once the batch's rows are on disk. Records without that line are ignored on
+    resume, and sink_position tells the sink where to roll back to, so rows of
+    wallets that were never marked done are not written twice.
+    """
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.state = {}
+        self.sink_position = None
+        if resume and os.path.exists(path):
+            batch, committed = [], False
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from a crash
+                    if 'sink_position' in record:
+                        self.state.update((r['wallet'], r) for r in batch)
+                        batch, committed = [], True
+                        self.sink_position = record['sink_position']
+                    else:
+                        batch.append(record)
+            if not committed:
+                # Written before batches were committed: trust every record
+                self.state.update((r['wallet'], r) for r in batch)
+        else:
+            # A fresh run starts from an empty sink
+            self.sink_position = 0
+            with open(path, 'w') as f:
+                f.write(json.dumps({'sink_position': 0}) + '\n')
+    
+    def completed(self):
+        return {wallet for wallet, record in self.state.items() if record['status'] == 'done'}
+    
+    def record_many(self, records, sink_position=None):
+        """Append records, commit them with the sink position their rows end at, and
+        fsync, so progress survives a crash right after"""
+        if not records:
+            return
+        with open(self.path, 'a') as f:
+            for record in records:
+                previous = self.state.get(record['wallet'], {})
+                record['attempts'] = previous.get('attempts', 0) + 1
+                record['time'] = int(time.time())
+                self.state[record['wallet']] = record
+                f.write(json.dumps(record) + '\n')
+            if sink_position is not None:
+                self.sink_position = sink_position
+                f.write(json.dumps({'sink_position': sink_position}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def failed(self):
+        """Latest record of every wallet whose last attempt failed"""
+        return [record for record in self.state.values() if record['status'] == 'failed']
+    
+    def write_failure_summary(self, path=FAILED_WALLETS_FILE):
+        failed = sorted(self.failed(), key=lambda r: (-r['attempts'], r['wallet']))
+        summary = pd.DataFrame(failed, columns=['wallet', 'attempts', 'error', 'last_block', 'time'])
+        if not summary.empty:
+            summary.to_csv(path, index=False)
+        elif os.path.exists(path):
+            os.remove(path)  # stale summary from an earlier run
+        return summary
+
 class CompoundDataCollector:
-    def __init__(self, etherscan_api_key):
-        self.api_key = etherscan_api_key
-        self.base_url = "https://api.etherscan.io/api"
-        self.rate_limit_delay = 0.25  # 4 requests per second to be safe
+    def __init__(self, etherscan_api_key, requests_per_second=ETHERSCAN_REQUESTS_PER_SECOND,
+                 max_workers=1, cache=None, base_url=ETHERSCAN_API_URL, recorder=None):
+        # base_url can point at replay_server.py to run without the real API
+        self.base_url = base_url
+        self.recorder = recorder
+        # Each key has its own limiter; all workers share the pool, so concurrency
+        # never exceeds the combined budget of the keys
+        self.key_pool = ApiKeyPool(etherscan_api_key, requests_per_second)
+        self.max_workers = max_workers
+        self.cache = cache
+        self.max_retries = MAX_REQUEST_RETRIES
+        self.failed_wallets = {}
         
-    def get_wallet_transactions(self, wallet_address, start_block=0, end_block=99999999):
-        """Fetch all transactions for a wallet address"""
-        try:
-            params = {
-                'module': 'account',
-                'action': 'txlist',
-                'address': wallet_address,
-                'startblock': start_block,
-                'endblock': end_block,
-                'page': 1,
-                'offset': 10000,  # Max allowed by Etherscan
-                'sort': 'asc',
-                'apikey': self.api_key
-            }
+        # Pooled keep-alive connections, sized so every worker can hold one
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(10, max_workers))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+    def _backoff(self, attempt):
+        """Sleep with full-jitter exponential backoff before retry number `attempt`"""
+        delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+        time.sleep(random.uniform(0, delay))
+    
+    def fetch_transaction_page(self, wallet_address, start_block, end_block):
+        """Fetch one txlist page for a block range, retrying transient failures"""
+        params = {
+            'module': 'account',
+            'action': 'txlist',
+            'address': wallet_address,
+            'startblock': start_block,
+            'endblock': end_block,
+            'page': 1,
+            'offset': ETHERSCAN_PAGE_SIZE,
+            'sort': 'asc'
+        }
+        
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._backoff(attempt - 1)
+            
+            api_key = self.key_pool.acquire()
+            params['apikey'] = api_key.key
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=30)
+            except requests.RequestException as e:
+                error = f"{type(e).__name__}: {e}"
+                continue
             
-            response = requests.get(self.base_url, params=params, timeout=30)
-            time.sleep(self.rate_limit_delay)
+            if response.status_code == 429:
+                self.key_pool.report_throttle(api_key)
+                error = "HTTP 429"
+                continue
+            if response.status_code >= 500:
+                error = f"HTTP {response.status_code}"
+                continue
+            if response.status_code != 200:
+                raise EtherscanAPIError(f"HTTP {response.status_code} for {wallet_address}: {response.text[:200]}")
             
-            if response.status_code == 200:
+            try:
                 data = response.json()
-                if data['status'] == '1':
-                    return data['result']
-                elif data['message'] == 'No transactions found':
-                    return []
-            print(f"API Error for {wallet_address}: {response.text}")
-            return []
-        except Exception as e:
-            print(f"Error fetching transactions for {wallet_address}: {e}")
-            return []
+            except ValueError:
+                error = f"Invalid JSON: {response.text[:200]}"
+                continue
+            
+            if data.get('status') == '1':
+                self.key_pool.report_success(api_key)
+                return data['result']
+            if data.get('message') == 'No transactions found':
+                self.key_pool.report_success(api_key)
+                return []
+            if is_rate_limited(data):
+                # Throttling is not "no transactions": slow down and try again
+                self.key_pool.report_throttle(api_key)
+                error = f"Rate limited: {data.get('result')}"
+                continue
+            if is_invalid_key(data):
+                # A revoked key is dropped from the pool and the request retried on another
+                self.key_pool.report_revoked(api_key)
+                error = f"Invalid API key: {data.get('result')}"
+                continue
+            raise EtherscanAPIError(f"API error for {wallet_address}: {data.get('message')} - {data.get('result')}")
+        
+        raise EtherscanAPIError(f"Giving up on {wallet_address} after {self.max_retries + 1} attempts: {error}")
+    
+    def iter_transaction_pages(self, wallet_address, start_block=0, end_block=LATEST_BLOCK):
+        """Yield a wallet's transactions page by page, walking adaptive block windows"""
+        cursor = start_block
+        window = end_block - start_block + 1  # Most wallets fit in a single request
+        
+        while cursor <= end_block:
+            window_end = min(end_block, cursor + window - 1)
+            page = self.fetch_transaction_page(wallet_address, cursor, window_end)
+            
+            if len(page) < ETHERSCAN_PAGE_SIZE:
+                # The whole window fit in one page; widen the next one if it was sparse
+                if page:
+                    yield page
+                cursor = window_end + 1
+                if len(page) < ETHERSCAN_PAGE_SIZE // 2:
+                    window *= 2
+                continue
+            
+            # The window filled up, so the last block may be cut off: keep complete
+            # blocks, resume from the last block and halve the window size
+            last_block = int(page[-1]['blockNumber'])
+            complete = [tx for tx in page if int(tx['blockNumber']) < last_block]
+            if complete:
+                yield complete
+                window = max(1, (last_block - cursor) // 2)
+                cursor = last_block
+            else:
+                # A single block holds a full page; there is no smaller window to split into
+                print(f"Warning: block {last_block} of {wallet_address} exceeds {ETHERSCAN_PAGE_SIZE} transactions")
+                yield page
+                window = 1
+                cursor = last_block + 1
+    
+    def iter_wallet_transactions(self, wallet_address):
+        """Yield a wallet's full history: cached pages first, then blocks after the high-water mark"""
+        if self.recorder is None:
+            yield from self._iter_history(wallet_address)
+            return
+        
+        # Record an empty page first so wallets without history still get a fixture
+        self.recorder.record(wallet_address, [])
+        for page in self._iter_history(wallet_address):
+            self.recorder.record(wallet_address, page)
+            yield page
+    
+    def _iter_history(self, wallet_address):
+        if self.cache is None:
+            yield from self.iter_transaction_pages(wallet_address)
+            return
+        
+        yield from self.cache.iter_pages(wallet_address)
+        
+        # Historical blocks never change, so only ask for blocks past the last one cached
+        last_block = self.cache.last_block(wallet_address)
+        start_block = 0 if last_block is None else last_block + 1
+        for page in self.iter_transaction_pages(wallet_address, start_block=start_block):
+            self.cache.append(wallet_address, page)
+            yield page
+    
+    def get_wallet_transactions(self, wallet_address, start_block=0, end_block=LATEST_BLOCK):
+        """Fetch all transactions for a wallet address"""
+        if start_block == 0 and end_block == LATEST_BLOCK:
+            pages = self.iter_wallet_transactions(wallet_address)
+        else:
+            pages = self.iter_transaction_pages(wallet_address, start_block, end_block)
+        return [tx for page in pages for tx in page]
     
     def parse_compound_action(self, input_data, contract_address):
         """Parse the function signature to determine action type"""
         if len(input_data) < 10:
             return None
-            
-        function_sig = input_data[:10].lower()
         
-        # Check if it's a V3 contract
-        if contract_address.lower() in [addr.lower() for addr in COMPOUND_V3_CONTRACTS.values()]:
-            if function_sig == COMPOUND_V3_FUNCTIONS['supply']:
-                return 'supply'
-            elif function_sig == COMPOUND_V3_FUNCTIONS['withdraw']:
-                return 'withdraw'
-            elif function_sig == COMPOUND_V3_FUNCTIONS['borrow']:
-                return 'borrow'
-            elif function_sig == COMPOUND_V3_FUNCTIONS['repay']:
-                return 'repay'
-        else:
-            # V2 contract
-            if function_sig == COMPOUND_V2_FUNCTIONS['mint']:
-                return 'supply'  # mint = supply in V2
-            elif function_sig in [COMPOUND_V2_FUNCTIONS['redeem'], COMPOUND_V2_FUNCTIONS['redeemUnderlying']]:
-                return 'redeem'
-            elif function_sig == COMPOUND_V2_FUNCTIONS['borrow']:
-                return 'borrow'
-            elif function_sig in [COMPOUND_V2_FUNCTIONS['repayBorrow'], COMPOUND_V2_FUNCTIONS['repayBorrowBehalf']]:
-                return 'repay'
-            elif function_sig == COMPOUND_V2_FUNCTIONS['liquidateBorrow']:
-                return 'liquidation'
-        
-        return None
+        function_sig = input_data[:10].lower()
+        entry = COMPOUND_DISPATCH.get((contract_address.lower(), function_sig))
+        if entry:
+            return entry[0]
+        # Contracts outside the table are decoded as V2 markets, as before
+        if contract_address.lower() in COMPOUND_V3_ADDRESSES:
+            return None
+        return V2_SELECTOR_ACTIONS.get(function_sig)
     
     def filter_compound_transactions(self, transactions):
         """Filter transactions to only include Compound protocol interactions"""
         compound_txs = []
-        compound_addresses = set([addr.lower() for addr in ALL_COMPOUND_CONTRACTS.values()])
         
         for tx in transactions:
-            # Check if transaction is to a Compound contract
-            if tx['to'] and tx['to'].lower() in compound_addresses:
-                # Parse function call
-                action_type = self.parse_compound_action(tx['input'], tx['to'])
-                if action_type:
-                    # Determine contract type and token
-                    contract_name = None
-                    for name, addr in ALL_COMPOUND_CONTRACTS.items():
-                        if addr.lower() == tx['to'].lower():
-                            contract_name = name
-                            break
-                    
-                    compound_tx = {
-                        'userWallet': tx['from'].lower(),
-                        'timestamp': int(tx['timeStamp']),
-                        'action': action_type,
-                        'contract_address': tx['to'].lower(),
-                        'contract_name': contract_name,
-                        'value_eth': float(tx['value']) / 1e18 if tx['value'] != '0' else 0,
-                        'gas_used': int(tx['gasUsed']) if tx['gasUsed'] else 0,
-                        'gas_price': int(tx['gasPrice']) if tx['gasPrice'] else 0,
-                        'tx_hash': tx['hash'],
-                        'block_number': int(tx['blockNumber']),
-                        'is_error': tx['isError'] == '1'
-                    }
-                    compound_txs.append(compound_tx)
+            # Check if transaction is a known Compound call
+            if not tx['to']:
+                continue
+            entry = COMPOUND_DISPATCH.get((tx['to'].lower(), tx['input'][:10].lower()))
+            if entry is None:
+                continue
+            action_type, contract_name, _ = entry
+            
+            compound_tx = {
+                'userWallet': tx['from'].lower(),
+                'timestamp': int(tx['timeStamp']),
+                'action': action_type,
+                'contract_address': tx['to'].lower(),
+                'contract_name': contract_name,
+                'value_eth': float(tx['value']) / 1e18 if tx['value'] != '0' else 0,
+                'gas_used': int(tx['gasUsed']) if tx['gasUsed'] else 0,
+                'gas_price': int(tx['gasPrice']) if tx['gasPrice'] else 0,
+                'tx_hash': tx['hash'],
+                'block_number': int(tx['blockNumber']),
+                'is_error': tx['isError'] == '1'
+            }
+            compound_txs.append(compound_tx)
         
         return compound_txs
     
-    def process_wallet_data(self, wallet_addresses):
+    def filter_compound_frame(self, transactions):
+        """Vectorized filter_compound_transactions: one page of raw txs to a columnar frame"""
+        # One dispatch lookup for the whole page; only matching rows are ever materialized
+        keys = [((tx['to'] or '') + tx['input'][:10]).lower() for tx in transactions]
+        positions = _DISPATCH_INDEX.get_indexer(keys) if keys else np.array([], dtype=np.intp)
+        hit = np.flatnonzero(positions >= 0)
+        if not len(hit):
+            return pd.DataFrame(columns=COMPOUND_TX_COLUMNS)
+        hits = [transactions[i] for i in hit]
+        positions = positions[hit]
+        
+        int_column = lambda name: np.array([int(tx[name] or 0) for tx in hits], dtype=np.int64)
+        return pd.DataFrame({
+            'userWallet': [tx['from'].lower() for tx in hits],
+            'timestamp': int_column('timeStamp'),
+            'action': _DISPATCH_ACTIONS[positions],
+            'contract_address': [tx['to'].lower() for tx in hits],
+            'contract_name': _DISPATCH_NAMES[positions],
+            'value_eth': np.array([float(tx['value']) for tx in hits]) / 1e18,
+            'gas_used': int_column('gasUsed'),
+            'gas_price': int_column('gasPrice'),
+            'tx_hash': [tx['hash'] for tx in hits],
+            'block_number': int_column('blockNumber'),
+            'is_error': np.array([tx['isError'] == '1' for tx in hits], dtype=bool)
+        })
+    
+    def collect_wallet(self, wallet):
+        """Fetch and filter the Compound transactions of a single wallet"""
+        # Filter page by page so only Compound interactions are kept in memory
+        frames = [self.filter_compound_frame(page) for page in self.iter_wallet_transactions(wallet.lower())]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=COMPOUND_TX_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+    
+    def _collect_or_record(self, wallet):
+        """collect_wallet, recording failures instead of raising them"""
+        try:
+            return self.collect_wallet(wallet)
+        except EtherscanAPIError as e:
+            # Pages cached before the failure are kept; the wallet is reported, not scored as empty
+            self.failed_wallets[wallet] = str(e)
+            print(f"  Failed {wallet}: {e}")
+            return pd.DataFrame(columns=COMPOUND_TX_COLUMNS)
+    
+    def iter_wallet_frames(self, wallet_addresses, max_workers=None):
+        """Yield (wallet, Compound frame) in input order with a bounded number of wallets in flight"""
+        max_workers = max_workers or self.max_workers
+        if max_workers <= 1:
+            for wallet in wallet_addresses:
+                yield wallet, self._collect_or_record(wallet)
+            return
+        
+        # Keep up to max_workers requests in flight; the shared key pool enforces the
+        # request budget. A small window of futures bounds how many results wait in memory.
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            for wallet in wallet_addresses:
+                pending.append((wallet, executor.submit(self._collect_or_record, wallet)))
+                if len(pending) >= 2 * max_workers:
+                    wallet, future = pending.popleft()
+                    yield wallet, future.result()
+            while pending:
+                wallet, future = pending.popleft()
+                yield wallet, future.result()
+    
+    def _report_progress(self, i, total, wallet, compound_txs):
+        if wallet in self.failed_wallets:
+            return
+        print(f"Wallet {i+1}/{total}: {wallet} - {len(compound_txs)} Compound transactions")
+    
+    def _checkpoint_record(self, wallet, compound_txs):
+        if wallet in self.failed_wallets:
+            return {'wallet': wallet, 'status': 'failed', 'rows': 0, 'last_block': None,
+                    'error': self.failed_wallets[wallet]}
+        if self.cache is not None:
+            last_block = self.cache.last_block(wallet)
+        else:
+            last_block = int(compound_txs['block_number'].max()) if not compound_txs.empty else None
+        return {'wallet': wallet, 'status': 'done', 'rows': len(compound_txs), 'last_block': last_block}
+    
+    def _commit_batch(self, sink, checkpoint, accumulator, records, frames):
+        """Flush the sink, fold its rows into the accumulator, then mark the wallets done"""
+        sink.flush()
+        # Replayed rows are skipped by the accumulator, so a crash before the
+        # checkpoint below only means they are fetched and skipped again
+        if accumulator is not None and frames and accumulator.update(pd.concat(frames, ignore_index=True)):
+            accumulator.save()
+        # Only mark wallets done once their rows are on disk
+        if checkpoint is not None:
+            checkpoint.record_many(records, sink.position())
+    
+    def collect_to_sink(self, wallet_addresses, sink, batch_rows=SINK_BATCH_ROWS, max_workers=None,
+                        checkpoint=None, accumulator=None):
+        """Stream filtered batches into `sink`; memory depends on batch_rows, not on wallet count
+        
+        A FeatureAccumulator is updated with each batch as it is flushed, so it
+        only ever sees the rows collected in this run.
+        """
+        total_rows = 0
+        pending = []  # checkpoint records whose rows are still in the sink buffer
+        frames = []  # the same rows, for the accumulator
+        print(f"Processing {len(wallet_addresses)} wallets with {max_workers or self.max_workers} worker(s)...")
+        
+        for i, (wallet, compound_txs) in enumerate(self.iter_wallet_frames(wallet_addresses, max_workers)):
+            self._report_progress(i, len(wallet_addresses), wallet, compound_txs)
+            if not compound_txs.empty:
+                sink.write(compound_txs)
+                total_rows += len(compound_txs)
+                if accumulator is not None:
+                    frames.append(compound_txs)
+            pending.append(self._checkpoint_record(wallet, compound_txs))
+            if sink.buffered_rows >= batch_rows:
+                self._commit_batch(sink, checkpoint, accumulator, pending, frames)
+                pending, frames = [], []
+        self._commit_batch(sink, checkpoint, accumulator, pending, frames)
+        
+        print(f"Total Compound transactions found: {total_rows}")
+        if self.failed_wallets:
+            print(f"Failed to fetch {len(self.failed_wallets)} wallet(s); their histories are incomplete")
+        return total_rows
+    
+    def process_wallet_data(self, wallet_addresses, max_workers=None):
         """Process all wallet addresses and return transaction data"""
-        all_transactions = []
+        all_transactions = []  # one frame per wallet with Compound activity
         
-        print(f"Processing {len(wallet_addresses)} wallets...")
+        print(f"Processing {len(wallet_addresses)} wallets with {max_workers or self.max_workers} worker(s)...")
         
-        for i, wallet in enumerate(wallet_addresses):
-            print(f"Processing wallet {i+1}/{len(wallet_addresses)}: {wallet}")
-            
-            # Get transactions
-            transactions = self.get_wallet_transactions(wallet.lower())
-            
-            if transactions:
-                # Filter for Compound interactions
-                compound_txs = self.filter_compound_transactions(transactions)
-                all_transactions.extend(compound_txs)
-                print(f"  Found {len(compound_txs)} Compound transactions")
-            else:
-                print(f"  No transactions found")
-            
-            # Rate limiting - be conservative
-            time.sleep(self.rate_limit_delay)
+        for i, (wallet, compound_txs) in enumerate(self.iter_wallet_frames(wallet_addresses, max_workers)):
+            self._report_progress(i, len(wallet_addresses), wallet, compound_txs)
+            if not compound_txs.empty:
+                all_transactions.append(compound_txs)
         
-        print(f"Total Compound transactions found: {len(all_transactions)}")
-        return pd.DataFrame(all_transactions)
+        df = pd.concat(all_transactions, ignore_index=True) if all_transactions else pd.DataFrame(columns=COMPOUND_TX_COLUMNS)
+        print(f"Total Compound transactions found: {len(df)}")
+        if self.failed_wallets:
+            print(f"Failed to fetch {len(self.failed_wallets)} wallet(s); their histories are incomplete")
+        return df
+
+# Raw columns feature engineering reads; the columnar store loads only these
+FEATURE_SOURCE_COLUMNS = ['userWallet', 'timestamp', 'action', 'contract_name', 'gas_used', 'is_error',
+                          'block_number']
+# The same columns read from CSV with the store's compact types
+FEATURE_SOURCE_DTYPES = {
+    'userWallet': 'category',
+    'timestamp': np.uint32,
+    'action': 'category',
+    'contract_name': 'category',
+    'gas_used': np.uint32,
+    'is_error': bool,
+    'block_number': np.uint32,
+    'value_eth': np.float64,
+}
+
+# Per-wallet accumulator state; every column merges exactly (sum, min, max)
+STATE_COUNT_COLUMNS = [f'count_{action}' for action in COMPOUND_ACTIONS]
+STATE_CONTRACT_COLUMNS = [f'used_{name}' for name in COMPOUND_CONTRACT_NAMES]
+STATE_MERGE = {
+    **{column: 'sum' for column in STATE_COUNT_COLUMNS},
+    'total_transactions': 'sum',
+    'total_gas_used': 'sum',
+    'first_timestamp': 'min',
+    'last_timestamp': 'max',
+    **{column: 'max' for column in STATE_CONTRACT_COLUMNS},
+    'last_block': 'max',
+}
+FEATURE_STATE_FILE = 'wallet_feature_state.npz'
+DEFAULT_FEATURE_WORKERS = 1
+STATE_MERGE_ROWS = 1000000  # pending per-chunk state rows folded together at once
+
+def empty_feature_state():
+    state = pd.DataFrame({column: np.array([], dtype=np.int64) for column in STATE_MERGE})
+    state.index = pd.Index([], dtype=object, name='userWallet')
+    return state
 
-def engineer_compound_features(df, wallet_addresses):
+def compute_feature_state(df, as_of=None):
+    """Per-wallet accumulator state for a batch of transactions
+    
+    Holds everything the features need and nothing that grows with history:
+    action counts, gas sum, first/last timestamp, which contracts were used
+    and the last block seen. Rows after as_of (unix seconds) are left out, so
+    features computed at a past as_of never see later transactions.
+    """
+    if as_of is not None:
+        df = df[df['timestamp'] <= as_of]
+    if df.empty:
+        return empty_feature_state()
+    
+    # The block high-water mark includes failed transactions; the features do not
+    last_block = None
+    if 'block_number' in df:
+        last_block = df.groupby('userWallet', observed=True)['block_number'].max().astype(np.int64)
+        last_block.index = pd.Index(np.asarray(last_block.index, dtype=object), name='userWallet')
+    
+    df = df[df['is_error'] == False]
+    if df.empty:
+        return empty_feature_state() if last_block is None else _block_only_state(last_block)
+    
+    # One pass over the data: action and contract counts from (wallet, key) groupbys,
+    # everything else from a single agg
+    counts = (df.groupby(['userWallet', 'action'], observed=True).size()
+              .unstack(fill_value=0)
+              .reindex(columns=COMPOUND_ACTIONS, fill_value=0))
+    contracts = (df.groupby(['userWallet', 'contract_name'], observed=True).size()
+                 .unstack(fill_value=0)
+                 .reindex(columns=COMPOUND_CONTRACT_NAMES, fill_value=0) > 0)
+    stats = df.groupby('userWallet', observed=True).agg(
+        total_transactions=('action', 'size'),
+        total_gas_used=('gas_used', 'sum'),
+        first_timestamp=('timestamp', 'min'),
+        last_timestamp=('timestamp', 'max'))
+    
+    wallets = pd.Index(np.asarray(stats.index, dtype=object), name='userWallet')
+    state = pd.DataFrame(index=wallets)
+    for action, column in zip(COMPOUND_ACTIONS, STATE_COUNT_COLUMNS):
+        state[column] = counts[action].reindex(stats.index, fill_value=0).to_numpy(np.int64)
+    for column in ['total_transactions', 'total_gas_used', 'first_timestamp', 'last_timestamp']:
+        state[column] = stats[column].to_numpy(np.int64)
+    for name, column in zip(COMPOUND_CONTRACT_NAMES, STATE_CONTRACT_COLUMNS):
+        state[column] = contracts[name].reindex(stats.index, fill_value=False).to_numpy(np.int64)
+    
+    if last_block is None:
+        state['last_block'] = -1
+        return state
+    state['last_block'] = last_block.reindex(wallets).to_numpy(np.int64)
+    # Wallets whose rows in this batch all failed still advance their block mark
+    failed_only = last_block[~last_block.index.isin(wallets)]
+    if len(failed_only):
+        state = merge_feature_states(state, _block_only_state(failed_only))
+    return state
+
+def _block_only_state(last_block):
+    """State rows that carry a block high-water mark but no transactions"""
+    state = empty_feature_state().reindex(last_block.index, fill_value=0)
+    state['first_timestamp'] = np.iinfo(np.int64).max
+    state['last_timestamp'] = np.iinfo(np.int64).min
+    state['last_block'] = last_block.to_numpy(np.int64)
+    return state
+
+def merge_feature_states(*states):
+    """Combine accumulator states; merging is exact and order-independent"""
+    states = [state for state in states if not state.empty]
+    if not states:
+        return empty_feature_state()
+    if len(states) == 1:
+        return states[0]
+    merged = pd.concat(states).groupby(level=0, sort=True).agg(STATE_MERGE)
+    merged.index.name = 'userWallet'
+    return merged
+
+def gather_wallet_rows(frame, wallet_addresses):
+    """One row per requested wallet, zeros for wallets missing from frame's index
+    
+    Rows are gathered by position instead of merged, so integer columns stay integers.
+    """
+    positions = pd.Index(frame.index, dtype=object).get_indexer(pd.Index(wallet_addresses, dtype=object))
+    found = positions >= 0
+    columns = {'userWallet': np.asarray(wallet_addresses, dtype=object)}
+    for name, values in frame.items():
+        column = np.zeros(len(positions), dtype=values.dtype)
+        column[found] = values.to_numpy()[positions[found]]
+        columns[name] = column
+    return pd.DataFrame(columns)
+
+def features_from_state(state, wallet_addresses, as_of=None):
+    """Derive the 19 wallet features from accumulator state, without rescanning history
+    
+    recent_activity is measured from as_of (unix seconds, default now), so the
+    same state and as_of always give the same features.
+    """
+    as_of = time.time() if as_of is None else as_of
+    state = state[state['total_transactions'] > 0]
+    
+    n = state['total_transactions'].to_numpy()
+    span_days = (state['last_timestamp'].to_numpy() - state['first_timestamp'].to_numpy()) / (24 * 3600)
+    counts = {action: state[column].to_numpy() for action, column in zip(COMPOUND_ACTIONS, STATE_COUNT_COLUMNS)}
+    unique_contracts = state[STATE_CONTRACT_COLUMNS].to_numpy().sum(axis=1)
+    
+    features = pd.DataFrame({
+        'total_transactions': n,
+        'num_supplies': counts['supply'],
+        'num_borrows': counts['borrow'],
+        'num_repays': counts['repay'],
+        'num_redeems': counts['redeem'],
+        'num_withdraws': counts['withdraw'],
+        'num_liquidations': counts['liquidation'],
+        'unique_contracts': unique_contracts,
+        'total_gas_used': state['total_gas_used'].to_numpy(),
+        'avg_gas_per_tx': state['total_gas_used'].to_numpy() / n,
+        'wallet_age_days': np.where(n > 1, span_days, 0),
+        'tx_frequency_per_day': np.where(n > 1, n / np.maximum(1, span_days), 0),
+        'has_liquidation': (counts['liquidation'] > 0).astype(int),
+        'liquidation_ratio': counts['liquidation'] / n,
+        'borrow_repay_ratio': counts['repay'] / np.maximum(1, counts['borrow']),
+        'supply_redeem_ratio': (counts['redeem'] + counts['withdraw']) / np.maximum(1, counts['supply']),
+        'diversification_score': unique_contracts / n,
+        'recent_activity': (as_of - state['last_timestamp'].to_numpy()) / (24 * 3600)  # Days since last activity
+    }).fillna(0)
+    
+    # Ensure all wallets are included, even those with no transactions
+    features = gather_wallet_rows(features.set_index(state.index), wallet_addresses)
+    
+    # Set default values for wallets with no activity
+    features.loc[features['recent_activity'] == 0, 'recent_activity'] = 99999
+    
+    return features
+
+# Narrowest dtypes that hold every feature's range; gas sums can pass 2**31
+FEATURE_DTYPES = {
+    'total_transactions': np.int32,
+    'num_supplies': np.int32,
+    'num_borrows': np.int32,
+    'num_repays': np.int32,
+    'num_redeems': np.int32,
+    'num_withdraws': np.int32,
+    'num_liquidations': np.int32,
+    'unique_contracts': np.int8,
+    'total_gas_used': np.int64,
+    'has_liquidation': np.int8,
+}
+
+def compact_features(features, float32=False):
+    """Intern wallet addresses as categorical codes and narrow the feature dtypes
+    
+    float32 also narrows the ratio/day columns. It is opt-in because values
+    like a 0.1 liquidation ratio move across the score thresholds.
+    """
+    compact = features.copy()
+    compact['userWallet'] = compact['userWallet'].astype('category')
+    for column in compact.columns:
+        if column in FEATURE_DTYPES:
+            compact[column] = compact[column].astype(FEATURE_DTYPES[column])
+        elif compact[column].dtype.kind == 'i':
+            # e.g. activity window counts and gas sums: the smallest type that holds them
+            compact[column] = pd.to_numeric(compact[column], downcast='integer')
+        elif float32 and compact[column].dtype.kind == 'f':
+            compact[column] = compact[column].astype(np.float32)
+    return compact
+
+def memory_mb(frame):
+    return frame.memory_usage(deep=True).sum() / 2 ** 20
+
+def feature_state_from_chunks(chunks, merge_rows=STATE_MERGE_ROWS, as_of=None):
+    """Accumulator state for transactions that arrive chunk by chunk
+    
+    Each chunk is reduced to its per-wallet partial state as soon as it is read;
+    partials are folded together whenever they add up to merge_rows, so memory
+    is bounded by one chunk plus the state, never the whole history.
+    """
+    state = empty_feature_state()
+    pending, pending_rows = [], 0
+    for chunk in chunks:
+        partial = compute_feature_state(chunk, as_of)
+        pending.append(partial)
+        pending_rows += len(partial)
+        if pending_rows >= merge_rows:
+            state = merge_feature_states(state, *pending)
+            pending, pending_rows = [], 0
+    return merge_feature_states(state, *pending)
+
+class FeatureAccumulator:
+    """Persistent per-wallet feature state, updated in O(new rows) per batch"""
+    def __init__(self, path=FEATURE_STATE_FILE):
+        self.path = path
+        self.state = empty_feature_state()
+        self.new_rows = 0  # rows merged by update() since loading
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as saved:
+                self.state = pd.DataFrame({column: saved[column] for column in STATE_MERGE},
+                                          index=pd.Index(saved['userWallet'].astype(object), name='userWallet'))
+    
+    def update(self, batch):
+        """Merge a batch of transactions, skipping blocks already accumulated"""
+        if batch.empty:
+            return 0
+        if 'block_number' in batch and not self.state.empty:
+            # Pages are block-complete, so anything at or below a wallet's last block is a replay
+            seen = self.state['last_block'].reindex(np.asarray(batch['userWallet'], dtype=object)).to_numpy()
+            batch = batch[~(batch['block_number'].to_numpy(np.int64) <= np.nan_to_num(seen, nan=-1))]
+        if not batch.empty:
+            self.state = merge_feature_states(self.state, compute_feature_state(batch))
+        self.new_rows += len(batch)
+        return len(batch)
+    
+    def features(self, wallet_addresses, as_of=None):
+        # The state cannot be rolled back, so it only serves an as_of after everything in it
+        latest = self.state.loc[self.state['total_transactions'] > 0, 'last_timestamp'].max()
+        if as_of is not None and not pd.isna(latest) and as_of < latest:
+            raise ValueError(f"{self.path} holds transactions up to {latest}, after as_of {as_of}; "
+                             f"compute features at that time without the saved state")
+        return features_from_state(self.state, wallet_addresses, as_of)
+    
+    def save(self):
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(tmp_path, userWallet=np.asarray(self.state.index, dtype=str),
+                 **{column: self.state[column].to_numpy(np.int64) for column in STATE_MERGE})
+        os.replace(tmp_path, self.path)
+
+def engineer_compound_features(df, wallet_addresses, as_of=None):
     """Engineer features from Compound transaction data"""
     if df.empty:
         print("No transaction data available for feature engineering")
@@ -235,146 +1364,453 @@ def engineer_compound_features(df, wallet_addresses):
         })
         return features
     
-    # Filter out failed transactions
-    df = df[df['is_error'] == False].copy()
+    # Same accumulator state the incremental path keeps, built from the whole frame
+    return features_from_state(compute_feature_state(df, as_of), wallet_addresses, as_of)
+
+def _store_partitions_state(root, partitions, as_of=None):
+    """Process-pool task: merged state of some raw-store partitions"""
+    store = RawTransactionStore(root)
+    return feature_state_from_chunks((chunk for partition in partitions
+                                      for chunk in store.iter_chunks(FEATURE_SOURCE_COLUMNS, partitions=[partition])),
+                                     as_of=as_of)
+
+def engineer_compound_features_from_store(store, wallet_addresses, max_workers=DEFAULT_FEATURE_WORKERS, as_of=None):
+    """engineer_compound_features straight from the raw store, one process per group of partitions
     
-    if not df.empty:
-        grouped = df.groupby('userWallet')
-        
-        features = pd.DataFrame({
-            'userWallet': grouped.groups.keys(),
-            'total_transactions': grouped.size(),
-            'num_supplies': grouped.apply(lambda x: (x['action'] == 'supply').sum(), include_groups=False),
-            'num_borrows': grouped.apply(lambda x: (x['action'] == 'borrow').sum(), include_groups=False),
-            'num_repays': grouped.apply(lambda x: (x['action'] == 'repay').sum(), include_groups=False),
-            'num_redeems': grouped.apply(lambda x: (x['action'] == 'redeem').sum(), include_groups=False),
-            'num_withdraws': grouped.apply(lambda x: (x['action'] == 'withdraw').sum(), include_groups=False),
-            'num_liquidations': grouped.apply(lambda x: (x['action'] == 'liquidation').sum(), include_groups=False),
-            'unique_contracts': grouped['contract_name'].nunique(),
-            'total_gas_used': grouped['gas_used'].sum(),
-            'avg_gas_per_tx': grouped['gas_used'].mean(),
-            'wallet_age_days': grouped['timestamp'].apply(lambda x: (x.max() - x.min()) / (24 * 3600) if len(x) > 1 else 0),
-            'tx_frequency_per_day': grouped.apply(lambda x: len(x) / max(1, (x['timestamp'].max() - x['timestamp'].min()) / (24 * 3600)) if len(x) > 1 else 0, include_groups=False),
-            'has_liquidation': grouped.apply(lambda x: (x['action'] == 'liquidation').any().astype(int), include_groups=False),
-            'liquidation_ratio': grouped.apply(lambda x: (x['action'] == 'liquidation').sum() / len(x), include_groups=False),
-            'borrow_repay_ratio': grouped.apply(lambda x: x[x['action'] == 'repay'].shape[0] / max(1, x[x['action'] == 'borrow'].shape[0]), include_groups=False),
-            'supply_redeem_ratio': grouped.apply(lambda x: x[x['action'].isin(['redeem', 'withdraw'])].shape[0] / max(1, x[x['action'] == 'supply'].shape[0]), include_groups=False),
-            'diversification_score': grouped['contract_name'].apply(lambda x: len(x.unique()) / len(x) if len(x) > 0 else 0),
-            'recent_activity': grouped['timestamp'].apply(lambda x: (time.time() - x.max()) / (24 * 3600))  # Days since last activity
-        }).fillna(0)
-        
-        features = features.reset_index(drop=True)
-    else:
-        # If no transactions found, create empty features
-        features = pd.DataFrame({
-            'userWallet': [],
-            'total_transactions': [],
-            'num_supplies': [],
-            'num_borrows': [],
-            'num_repays': [],
-            'num_redeems': [],
-            'num_withdraws': [],
-            'num_liquidations': [],
-            'unique_contracts': [],
-            'total_gas_used': [],
-            'avg_gas_per_tx': [],
-            'wallet_age_days': [],
-            'tx_frequency_per_day': [],
-            'has_liquidation': [],
-            'liquidation_ratio': [],
-            'borrow_repay_ratio': [],
-            'supply_redeem_ratio': [],
-            'diversification_score': [],
-            'recent_activity': []
-        })
+    Partitions already shard the rows by wallet hash, so workers read their own
+    chunks from disk and only the per-wallet states travel between processes.
+    """
+    # More processes than cores only adds start-up and scheduling cost
+    max_workers = min(max_workers, os.cpu_count() or 1)
+    if max_workers <= 1:
+        return engineer_compound_features_from_chunks(iter_store_feature_chunks(store), wallet_addresses, as_of)
+    groups = [list(range(worker, store.n_partitions, max_workers)) for worker in range(max_workers)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        states = list(executor.map(_store_partitions_state, [store.root] * len(groups), groups,
+                                   itertools.repeat(as_of)))
+    state = merge_feature_states(*states)
+    if state.empty:
+        return engineer_compound_features(pd.DataFrame(columns=FEATURE_SOURCE_COLUMNS), wallet_addresses)
+    return features_from_state(state, wallet_addresses, as_of)
+
+def engineer_compound_features_from_chunks(chunks, wallet_addresses, as_of=None):
+    """engineer_compound_features for data bigger than memory, e.g. store.iter_chunks()
     
-    # Ensure all wallets are included, even those with no transactions
-    all_wallets_df = pd.DataFrame({'userWallet': wallet_addresses})
-    features = all_wallets_df.merge(features, on='userWallet', how='left').fillna(0)
+    The state merge is exact, so the features are identical to the in-memory path.
+    """
+    state = feature_state_from_chunks(chunks, as_of=as_of)
+    if state.empty:
+        return engineer_compound_features(pd.DataFrame(columns=FEATURE_SOURCE_COLUMNS), wallet_addresses)
+    return features_from_state(state, wallet_addresses, as_of)
+
+def iter_store_feature_chunks(store, columns=FEATURE_SOURCE_COLUMNS):
+    """Store chunks in partition order; a partition holds all rows of its wallets"""
+    for partition in range(store.n_partitions):
+        yield from store.iter_chunks(columns, partitions=[partition])
+
+# Trailing activity windows, in days before the as-of time
+ACTIVITY_WINDOWS_DAYS = [30, 90, 365]
+WINDOW_SOURCE_COLUMNS = ['userWallet', 'timestamp', 'action', 'gas_used', 'value_eth', 'is_error']
+
+def window_feature_columns(windows):
+    columns = []
+    for days in windows:
+        columns += [f'tx_count_{days}d', f'gas_used_{days}d', f'volume_eth_{days}d']
+        for action in COMPOUND_ACTIONS:
+            columns += [f'{action}_count_{days}d', f'{action}_gas_{days}d', f'{action}_volume_eth_{days}d']
+    return columns
+
+def compute_window_state(df, as_of, windows=ACTIVITY_WINDOWS_DAYS):
+    """Per-wallet transaction counts, gas and ETH volume per action in each trailing window
     
-    # Set default values for wallets with no activity
-    features.loc[features['recent_activity'] == 0, 'recent_activity'] = 99999
+    Rows are sorted once by (wallet, action, timestamp); every window is then
+    one vectorized binary search for its cutoff in all groups at once, with
+    sums read off prefix sums. Counts and sums add up across chunks, so states
+    of different chunks merge with merge_window_states.
+    """
+    df = df[df['is_error'] == False]
+    actions = pd.Categorical(df['action'], categories=COMPOUND_ACTIONS).codes.astype(np.int64)
+    df = df[actions >= 0]
+    actions = actions[actions >= 0]
+    if df.empty:
+        return empty_window_state(windows)
     
-    return features
+    wallet_codes, wallets = pd.factorize(df['userWallet'])
+    groups = wallet_codes.astype(np.int64) * len(COMPOUND_ACTIONS) + actions
+    timestamps = df['timestamp'].to_numpy(np.int64)
+    order = np.lexsort((timestamps, groups))
+    # (group, timestamp) packed into one sorted key; timestamps fit in 32 bits
+    keys = groups[order] * 2 ** 32 + timestamps[order]
+    gas = np.concatenate([[0], np.cumsum(df['gas_used'].to_numpy(np.int64)[order])])
+    volume = np.concatenate([[0.0], np.cumsum(df['value_eth'].to_numpy(np.float64)[order])])
+    
+    group_keys = np.unique(groups)
+    group_wallets = group_keys // len(COMPOUND_ACTIONS)
+    group_actions = group_keys % len(COMPOUND_ACTIONS)
+    # Rows after the as-of time are outside every window
+    end = np.searchsorted(keys, group_keys * 2 ** 32 + int(as_of), side='right')
+    
+    n_wallets = len(wallets)
+    state = {}
+    for days in windows:
+        cutoff = max(0, int(as_of) - days * 24 * 3600)
+        start = np.searchsorted(keys, group_keys * 2 ** 32 + cutoff, side='left')
+        metrics = [('tx_count', 'count', end - start),
+                   ('gas_used', 'gas', gas[end] - gas[start]),
+                   ('volume_eth', 'volume_eth', volume[end] - volume[start])]
+        for total, metric, values in metrics:
+            per_action = np.zeros((n_wallets, len(COMPOUND_ACTIONS)), dtype=values.dtype)
+            per_action[group_wallets, group_actions] = values
+            state[f'{total}_{days}d'] = per_action.sum(axis=1)
+            for i, action in enumerate(COMPOUND_ACTIONS):
+                state[f'{action}_{metric}_{days}d'] = per_action[:, i]
+    
+    index = pd.Index(np.asarray(wallets, dtype=object), name='userWallet')
+    return pd.DataFrame(state, index=index)[window_feature_columns(windows)]
 
-def calculate_risk_scores(features):
-    """Calculate risk scores based on engineered features"""
-    if features.empty:
-        return features
+def empty_window_state(windows=ACTIVITY_WINDOWS_DAYS):
+    state = pd.DataFrame({column: np.array([], dtype=np.float64 if 'volume' in column else np.int64)
+                          for column in window_feature_columns(windows)})
+    state.index = pd.Index([], dtype=object, name='userWallet')
+    return state
+
+def merge_window_states(*states):
+    """Combine window states of different chunks; counts and sums simply add"""
+    nonempty = [state for state in states if not state.empty]
+    if len(nonempty) <= 1:
+        return nonempty[0] if nonempty else states[0]
+    merged = pd.concat(nonempty).groupby(level=0, sort=True).sum()
+    merged.index.name = 'userWallet'
+    return merged
+
+def window_features_from_chunks(chunks, wallet_addresses, as_of, windows=ACTIVITY_WINDOWS_DAYS,
+                                merge_rows=STATE_MERGE_ROWS):
+    """Windowed activity features for every wallet, in wallet_addresses order"""
+    state = empty_window_state(windows)
+    pending, pending_rows = [], 0
+    for chunk in chunks:
+        partial = compute_window_state(chunk, as_of, windows)
+        pending.append(partial)
+        pending_rows += len(partial)
+        if pending_rows >= merge_rows:
+            state = merge_window_states(state, *pending)
+            pending, pending_rows = [], 0
+    return gather_wallet_rows(merge_window_states(state, *pending), wallet_addresses)
+
+FEATURE_SNAPSHOT_DIR = 'feature_snapshots'
+
+def raw_high_water_block(chunks):
+    """Highest block number in the raw transactions, -1 if there are none"""
+    return max((int(chunk['block_number'].max()) for chunk in chunks if len(chunk)), default=-1)
+
+class FeatureSnapshots:
+    """Versioned feature tables keyed by (as_of, high-water block)
     
-    scores = []
+    Each snapshot is a directory of one .npy file per column plus meta.json:
     
-    for _, row in features.iterrows():
-        # Base score starts at 500 (neutral)
-        score = 500
-        
-        # Transaction history bonus (up to +200 points)
-        if row['total_transactions'] > 0:
-            tx_bonus = min(100, row['total_transactions'] * 2)  # 2 points per transaction, max 100
-            age_bonus = min(100, row['wallet_age_days'] * 0.5)  # 0.5 points per day, max 100
-            score += tx_bonus + age_bonus
-        else:
-            # No transaction history = significant risk
-            score -= 300
-        
+        <root>/asof-1700000000-block-18500000/recent_activity.npy
+    
+    Loading memory-maps the feature columns, so scoring or a backtest can
+    reuse a snapshot without recomputing or even reading every feature.
+    """
+    def __init__(self, root=FEATURE_SNAPSHOT_DIR):
+        self.root = root
+    
+    def path(self, as_of, high_water_block):
+        return os.path.join(self.root, f'asof-{int(as_of)}-block-{int(high_water_block)}')
+    
+    def list(self):
+        """(as_of, high_water_block) of every stored snapshot, oldest as_of first"""
+        keys = []
+        for path in glob.glob(os.path.join(self.root, 'asof-*-block-*[0-9]')):
+            _, as_of, _, block = os.path.basename(path).split('-', 3)
+            keys.append((int(as_of), int(block)))
+        return sorted(keys)
+    
+    def read_meta(self, as_of, high_water_block):
+        meta_path = os.path.join(self.path(as_of, high_water_block), 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r') as f:
+            return json.load(f)
+    
+    def write(self, features, as_of, high_water_block, **meta):
+        """Save a feature table; extra keyword arguments are kept in meta.json"""
+        final_dir = self.path(as_of, high_water_block)
+        tmp_dir = final_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        columns = [column for column in features.columns if column != 'userWallet']
+        np.save(os.path.join(tmp_dir, 'userWallet.npy'), np.asarray(features['userWallet'].astype(str), dtype='S'))
+        for column in columns:
+            np.save(os.path.join(tmp_dir, column + '.npy'), features[column].to_numpy())
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'version': 1, 'as_of': int(as_of), 'high_water_block': int(high_water_block),
+                       'wallets': len(features), 'columns': columns, **meta}, f, indent=2)
+        # Replace an older snapshot with the same key in one step
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+        return final_dir
+    
+    def load(self, as_of, high_water_block, columns=None):
+        """Feature frame of a snapshot with memory-mapped columns, or None if there is none"""
+        meta = self.read_meta(as_of, high_water_block)
+        if meta is None:
+            return None
+        path = self.path(as_of, high_water_block)
+        wallets = np.load(os.path.join(path, 'userWallet.npy'), mmap_mode='r')
+        frame = {'userWallet': pd.Categorical(wallets.astype(str))}
+        for column in columns or meta['columns']:
+            frame[column] = np.load(os.path.join(path, column + '.npy'), mmap_mode='r')
+        return pd.DataFrame(frame, copy=False)
+
+SCORE_VARIANTS_FILE = 'wallet_score_variants.csv'
+SCORING_BATCH_CELLS = 1 << 16  # (rule set, wallet) scores evaluated per block, sized for the CPU cache
+SCORING_OPERATORS = {'>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal,
+                     '==': np.equal, '!=': np.not_equal}
+
+# The risk score rules as data. Starting from 'base', each rule adds points in order:
+#   'cases': [op, threshold, points] tested on 'feature', first match wins, else 'default' (0)
+#   'terms': [feature, points_per_unit, cap] summed, each term min(cap, value * points_per_unit)
+#   'when' : [feature, op, value] gate; wallets failing it get 'otherwise' (0) instead
+# The total is clipped to 'bounds' and rounded half to even.
+DEFAULT_SCORING_RULES = {
+    'name': 'default',
+    'base': 500,
+    'bounds': [0, 1000],
+    'rules': [
+        # Transaction history bonus (up to +200 points); no history = significant risk
+        {'name': 'history', 'when': ['total_transactions', '>', 0], 'otherwise': -300,
+         'terms': [['total_transactions', 2, 100], ['wallet_age_days', 0.5, 100]]},
         # Liquidation penalty (severe)
-        if row['has_liquidation']:
-            score -= 400  # Heavy penalty for liquidations
-        
-        liquidation_penalty = row['liquidation_ratio'] * 300
-        score -= liquidation_penalty
-        
+        {'name': 'liquidated', 'feature': 'has_liquidation', 'cases': [['!=', 0, -400]]},
+        {'name': 'liquidation_ratio', 'terms': [['liquidation_ratio', -300, None]]},
         # Borrow/Repay behavior (up to +/-150 points)
-        if row['num_borrows'] > 0:
-            if row['borrow_repay_ratio'] >= 1.0:
-                score += 150  # Good repayment behavior
-            elif row['borrow_repay_ratio'] >= 0.8:
-                score += 100  # Decent repayment
-            elif row['borrow_repay_ratio'] >= 0.5:
-                score += 50   # Moderate repayment
-            else:
-                score -= 100  # Poor repayment history
-        
-        # Activity frequency bonus/penalty
-        if row['tx_frequency_per_day'] > 1:
-            score += 50   # Very active user
-        elif row['tx_frequency_per_day'] > 0.1:
-            score += 25   # Moderately active
-        
-        # Recent activity bonus
-        if row['recent_activity'] < 30:  # Active in last 30 days
-            score += 50
-        elif row['recent_activity'] < 90:  # Active in last 90 days
-            score += 25
-        elif row['recent_activity'] > 365:  # Inactive for over a year
-            score -= 100
-        
+        {'name': 'repayment', 'when': ['num_borrows', '>', 0], 'feature': 'borrow_repay_ratio',
+         'cases': [['>=', 1.0, 150], ['>=', 0.8, 100], ['>=', 0.5, 50]], 'default': -100},
+        # Activity frequency bonus
+        {'name': 'frequency', 'feature': 'tx_frequency_per_day', 'cases': [['>', 1, 50], ['>', 0.1, 25]]},
+        # Recent activity: last 30 days, last 90 days, inactive for over a year
+        {'name': 'recency', 'feature': 'recent_activity',
+         'cases': [['<', 30, 50], ['<', 90, 25], ['>', 365, -100]]},
         # Diversification bonus
-        if row['unique_contracts'] > 3:
-            score += 30
-        elif row['unique_contracts'] > 1:
-            score += 15
-        
-        # Gas efficiency (proxy for sophistication)
-        if row['avg_gas_per_tx'] > 0:
-            if row['avg_gas_per_tx'] < 100000:  # Efficient gas usage
-                score += 25
-            elif row['avg_gas_per_tx'] > 500000:  # Wasteful gas usage
-                score -= 25
-        
-        # Ensure score is within bounds
-        score = max(0, min(1000, score))
-        scores.append(round(score))
-    
-    features['score'] = scores
+        {'name': 'diversification', 'feature': 'unique_contracts', 'cases': [['>', 3, 30], ['>', 1, 15]]},
+        # Gas efficiency (proxy for sophistication): efficient vs wasteful gas usage
+        {'name': 'gas', 'when': ['avg_gas_per_tx', '>', 0], 'feature': 'avg_gas_per_tx',
+         'cases': [['<', 100000, 25], ['>', 500000, -25]]},
+    ],
+}
+
+def _rule_shape(rule):
+    """Everything about a rule except its numbers; rule sets scored together must agree on it"""
+    if ('cases' in rule) == ('terms' in rule):
+        raise ValueError(f"Scoring rule {rule.get('name')!r} needs exactly one of 'cases' or 'terms'")
+    ops = [rule['when'][1]] if 'when' in rule else []
+    ops += [op for op, _, _ in rule.get('cases', [])]
+    unknown = set(ops) - set(SCORING_OPERATORS)
+    if unknown:
+        raise ValueError(f"Scoring rule {rule.get('name')!r} uses unknown operator(s) {sorted(unknown)}")
+    return (rule.get('when', [None, None])[:2], rule.get('feature'), [op for op, _, _ in rule.get('cases', [])],
+            [(feature, cap is None) for feature, _, cap in rule.get('terms', [])])
+
+def _stack(values):
+    """Per-rule-set numbers as a (rule sets, 1) column, or (1, 1) when every set agrees"""
+    column = np.asarray(values, dtype=np.float64).reshape(-1, 1)
+    return column[:1] if (column == column[0]).all() else column
+
+def _cell_values(cuts):
+    """One value per cell of the number line split at cuts: below, at and between each cut, above, NaN
+    
+    Every value in a cell compares the same as its representative against every cut.
+    """
+    values = np.empty(2 * len(cuts) + 2)
+    values[1:-1:2] = cuts
+    values[0] = np.nextafter(cuts[0], -np.inf)
+    values[2:-1:2] = np.nextafter(cuts, np.inf)
+    values[-1] = np.nan
+    return values
+
+def _cells(values, cuts):
+    """Cell of each value among those described by _cell_values(cuts)"""
+    position = np.searchsorted(cuts, values)  # cuts below the value; NaN sorts past the end
+    equal = cuts[np.minimum(position, len(cuts) - 1)] == values
+    cells = 2 * position + equal
+    cells[np.isnan(values)] = 2 * len(cuts) + 1
+    return cells
+
+def _gate(rule, values, points):
+    """Points where the rule's 'when' gate holds, 'otherwise' elsewhere"""
+    if not rule['when']:
+        return points
+    feature, op, value, otherwise = rule['when']
+    return np.where(op(values[feature], value), points, otherwise)
+
+def _rule_points(rule, values, gate=True):
+    """Points one compiled rule adds, for (1, wallets) feature rows; (rule sets or 1, wallets)"""
+    if rule['cases']:
+        x = values[rule['feature']]
+        points = np.select([op(x, threshold) for op, threshold, _ in rule['cases']],
+                           [points for _, _, points in rule['cases']], rule['default'])
+    else:
+        # Terms are summed before being added, as min(cap, a) + min(cap, b)
+        points = None
+        for feature, rate, cap in rule['terms']:
+            term = values[feature] * rate
+            if cap is not None:
+                term = np.where(term < cap, term, cap)
+            points = term if points is None else points + term
+    return _gate(rule, values, points) if gate else points
+
+class ScoringRuleSets:
+    """Rule sets compiled into one vectorized evaluator
+    
+    All rule sets must share the same rules, features and operators; thresholds,
+    points, caps, base and bounds may differ. A 'cases' rule is compiled into a
+    table of its points for every rule set over the cells its thresholds (from
+    all sets) cut its feature into, so scoring it is one cell lookup per wallet
+    and one gather for all K sets; its gate and 'terms' rules are computed
+    directly. The table is K x O(K) whatever the gate does.
+    """
+    def __init__(self, rule_sets):
+        rule_sets = list(rule_sets)
+        if not rule_sets:
+            raise ValueError("No scoring rule sets given")
+        shape = [_rule_shape(rule) for rule in rule_sets[0]['rules']]
+        for i, rule_set in enumerate(rule_sets[1:], start=1):
+            if [_rule_shape(rule) for rule in rule_set['rules']] != shape:
+                raise ValueError(f"Scoring rule set {i} ({rule_set.get('name')!r}) differs in structure "
+                                 f"from {rule_sets[0].get('name')!r}; only thresholds and points may vary")
+        
+        self.names = [rule_set.get('name') or f'variant_{i}' for i, rule_set in enumerate(rule_sets)]
+        self.base = _stack([rule_set['base'] for rule_set in rule_sets])
+        self.low = _stack([rule_set['bounds'][0] for rule_set in rule_sets])
+        self.high = _stack([rule_set['bounds'][1] for rule_set in rule_sets])
+        self.rules = []
+        for position, rule in enumerate(rule_sets[0]['rules']):
+            versions = [rule_set['rules'][position] for rule_set in rule_sets]
+            compiled = {'feature': rule.get('feature'), 'when': None, 'cases': [], 'terms': []}
+            if 'when' in rule:
+                feature, op, _ = rule['when']
+                compiled['when'] = (feature, SCORING_OPERATORS[op], _stack([v['when'][2] for v in versions]),
+                                    _stack([v.get('otherwise', 0) for v in versions]))
+            for i, (op, _, _) in enumerate(rule.get('cases', [])):
+                compiled['cases'].append((SCORING_OPERATORS[op], _stack([v['cases'][i][1] for v in versions]),
+                                          _stack([v['cases'][i][2] for v in versions])))
+            compiled['default'] = _stack([v.get('default', 0) for v in versions])
+            for i, (feature, _, cap) in enumerate(rule.get('terms', [])):
+                compiled['terms'].append((feature, _stack([v['terms'][i][1] for v in versions]),
+                                          None if cap is None else _stack([v['terms'][i][2] for v in versions])))
+            if compiled['cases']:
+                self._compile_table(compiled)
+            self.rules.append(compiled)
+        self.features = sorted({rule['feature'] for rule in self.rules if rule['feature']}
+                               | {rule['when'][0] for rule in self.rules if rule['when']}
+                               | {term[0] for rule in self.rules for term in rule['terms']})
+    
+    @staticmethod
+    def _compile_table(rule):
+        """Ungated points of a 'cases' rule for every rule set and cell of its feature"""
+        thresholds = np.concatenate([threshold for _, threshold, _ in rule['cases']], axis=None)
+        # NaN thresholds never compare true, so they split nothing
+        rule['cuts'] = np.unique(thresholds[~np.isnan(thresholds)])
+        values = {rule['feature']: _cell_values(rule['cuts']).reshape(1, -1)}
+        rule['table'] = _rule_points(rule, values, gate=False)
+    
+    def score(self, features):
+        """Scores as a (rule sets, wallets) int64 array, row k for rule set k"""
+        columns = {name: features[name].to_numpy(dtype=np.float64) for name in self.features}
+        # Cell of each wallet in each rule's table
+        lookups = [_cells(columns[rule['feature']], rule['cuts']) if rule['cases'] else None for rule in self.rules]
+        
+        scores = np.empty((len(self.names), len(features)), dtype=np.int64)
+        block = max(1, SCORING_BATCH_CELLS // len(self.names))
+        for start in range(0, len(features), block):
+            stop = min(start + block, len(features))
+            values = {name: column[None, start:stop] for name, column in columns.items()}
+            score = self.base + np.zeros((len(self.names), stop - start))
+            for rule, index in zip(self.rules, lookups):
+                if index is not None:
+                    score += _gate(rule, values, rule['table'][:, index[start:stop]])
+                else:
+                    score += _rule_points(rule, values)
+            # min/max written out so NaN compares like Python's min(high, max(low, score))
+            score = np.where(score < self.high, score, self.high)
+            score = np.where(score > self.low, score, self.low)
+            scores[:, start:stop] = np.rint(score)
+        return scores
+
+def load_scoring_rules(path):
+    """Rule sets from a JSON file holding one rule set or a list of them"""
+    with open(path, 'r') as f:
+        rule_sets = json.load(f)
+    return rule_sets if isinstance(rule_sets, list) else [rule_sets]
+
+def calculate_risk_scores(features, rules=DEFAULT_SCORING_RULES):
+    """Calculate risk scores based on engineered features
+    
+    Rules are applied in order with Python's min/max/round semantics, so the
+    default rule set scores exactly like the original per-row implementation.
+    """
+    if features.empty:
+        return features
+    
+    features['score'] = ScoringRuleSets([rules]).score(features)[0]
     return features
 import os
 from dotenv import load_dotenv
 load_dotenv()
-def main():
-    # Configuration
-    ETHERSCAN_API_KEY = os.getenv("ETHERSCAN_API_KEY") 
-    WALLET_CSV_FILE = "Wallet.csv"  # Match your file name
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compound wallet risk scoring")
+    parser.add_argument('--wallets', default="Wallet.csv", help="CSV file with a wallet_id column")
+    parser.add_argument('--workers', type=int, default=DEFAULT_COLLECTOR_WORKERS,
+                        help="Concurrent API requests in flight (1 = sequential)")
+    parser.add_argument('--requests-per-second', type=float, default=ETHERSCAN_REQUESTS_PER_SECOND,
+                        help="Request budget per API key (override per key with key:rate)")
+    parser.add_argument('--cache-dir', default="tx_cache",
+                        help="Directory for cached wallet transactions")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Always fetch full histories from the API")
+    parser.add_argument('--base-url', default=ETHERSCAN_API_URL,
+                        help="txlist endpoint, e.g. a local replay_server.py")
+    parser.add_argument('--record-fixtures', metavar='DIR',
+                        help="Save every fetched history as replay fixtures in DIR")
+    parser.add_argument('--raw-format', choices=['store', 'csv'], default='store',
+                        help=f"Raw transactions as a columnar store in --raw-store or as {RAW_TRANSACTIONS_FILE}")
+    parser.add_argument('--raw-store', default=RAW_STORE_DIR,
+                        help="Directory of the columnar raw-transaction store")
+    parser.add_argument('--feature-state', nargs='?', const=FEATURE_STATE_FILE,
+                        help="Keep per-wallet feature accumulators here and update them incrementally")
+    parser.add_argument('--feature-workers', type=int, default=DEFAULT_FEATURE_WORKERS,
+                        help="Processes computing features from the raw store, each over its own partitions "
+                             "(capped at the number of CPU cores)")
+    parser.add_argument('--activity-windows', type=lambda value: [int(v) for v in value.split(',') if v],
+                        default=ACTIVITY_WINDOWS_DAYS,
+                        help="Comma-separated trailing windows in days for activity features ('' = none)")
+    parser.add_argument('--as-of', type=int,
+                        help="Unix time features are computed at (default: now); fixes recent_activity and windows")
+    parser.add_argument('--snapshot-dir', default=FEATURE_SNAPSHOT_DIR,
+                        help="Versioned feature snapshots keyed by (as-of, highest raw block); "
+                             "only written and reused when --as-of is given")
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help="Neither reuse nor write a feature snapshot")
+    parser.add_argument('--float32-features', action='store_true',
+                        help="Also store ratio/day features as float32 (may move scores at thresholds)")
+    parser.add_argument('--scoring-rules', metavar='JSON',
+                        help="Score with rule sets from this file instead of the built-in rules; with several, "
+                             f"the first is used for wallet_scores.csv and all are written to {SCORE_VARIANTS_FILE}")
+    parser.add_argument('--resume', action='store_true',
+                        help=f"Skip wallets completed in {CHECKPOINT_FILE} and append to the existing raw data")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    # Configuration: ETHERSCAN_API_KEYS="key1,key2:10" spreads load over several keys
+    ETHERSCAN_API_KEYS = parse_api_keys(os.getenv("ETHERSCAN_API_KEYS") or os.getenv("ETHERSCAN_API_KEY"),
+                                        default_rate=args.requests_per_second)
+    WALLET_CSV_FILE = args.wallets
+    # Compiled up front so a bad rules file fails before any data is collected
+    rule_sets = ScoringRuleSets(load_scoring_rules(args.scoring_rules)) if args.scoring_rules else None
     
     print(f"Starting main function at {datetime.now()}")
     print(f"\n0. Loading wallet addresses from {WALLET_CSV_FILE}...")
@@ -390,26 +1826,118 @@ def main():
         return
     
     print("\n1. Initializing data collector...")
-    collector = CompoundDataCollector(ETHERSCAN_API_KEY)
+    cache = None if args.no_cache else TransactionCache(args.cache_dir)
+    recorder = None
+    if args.record_fixtures:
+        from replay_server import FixtureRecorder
+        recorder = FixtureRecorder(args.record_fixtures)
+    collector = CompoundDataCollector(ETHERSCAN_API_KEYS or None,
+                                      requests_per_second=args.requests_per_second,
+                                      max_workers=args.workers,
+                                      cache=cache,
+                                      base_url=args.base_url,
+                                      recorder=recorder)
     print("\n2. Fetching transaction data from Compound protocols...")
-    df = collector.process_wallet_data(wallet_addresses)
-    print(f"DataFrame shape after fetching: {df.shape}")
+    checkpoint = CollectionCheckpoint(CHECKPOINT_FILE, resume=args.resume)
+    completed = checkpoint.completed()
+    pending_wallets = [wallet for wallet in wallet_addresses if wallet not in completed]
+    if args.resume:
+        print(f"Resuming: {len(completed)} wallets already done, {len(pending_wallets)} to fetch")
     
-    # Initialize data collector
-    collector = CompoundDataCollector(ETHERSCAN_API_KEY)
+    # Filtered batches stream straight to disk; nothing accumulates per wallet in memory
+    if args.raw_format == 'store':
+        sink = RawTransactionStore(args.raw_store)
+        if not args.resume:
+            sink.clear()
+    else:
+        sink = CsvTransactionSink(RAW_TRANSACTIONS_FILE, append=args.resume)
+    if args.resume and checkpoint.sink_position is not None:
+        # Rows flushed after the last checkpoint belong to wallets that will be fetched again
+        sink.rollback(checkpoint.sink_position)
     
-    # Process all wallets
-    print("\n1. Fetching transaction data from Compound protocols...")
-    df = collector.process_wallet_data(wallet_addresses)
+    # Raw transactions are read back chunk by chunk, never as one frame
+    def raw_chunks(columns=FEATURE_SOURCE_COLUMNS):
+        if args.raw_format == 'store':
+            return iter_store_feature_chunks(sink, columns)
+        return pd.read_csv(RAW_TRANSACTIONS_FILE, usecols=columns, dtype=FEATURE_SOURCE_DTYPES,
+                           chunksize=SINK_BATCH_ROWS)
     
-    # Save raw transaction data
-    if not df.empty:
-        df.to_csv('compound_transactions_raw.csv', index=False)
-        print(f"Saved raw transaction data: {len(df)} transactions")
+    # The accumulator is fed the batches collected below, never the whole raw history
+    accumulator = None
+    if args.feature_state:
+        seed = args.resume and not os.path.exists(args.feature_state)
+        accumulator = FeatureAccumulator(args.feature_state)
+        if seed:
+            # Wallets finished before the state existed are not fetched again
+            for chunk in raw_chunks():
+                accumulator.update(chunk)
+            accumulator.save()
+    with sink:
+        total_rows = collector.collect_to_sink(pending_wallets, sink, checkpoint=checkpoint, accumulator=accumulator)
+    if accumulator is not None:
+        print(f"Merged {accumulator.new_rows} new transactions into {args.feature_state}")
     
-    # Engineer features
-    print("\n2. Engineering risk assessment features...")
-    features = engineer_compound_features(df, wallet_addresses)
+    summary = checkpoint.write_failure_summary()
+    if not summary.empty:
+        repeated = int((summary['attempts'] > 1).sum())
+        print(f"{len(summary)} wallet(s) failed ({repeated} repeatedly); see {FAILED_WALLETS_FILE}, "
+              f"rerun with --resume to retry them")
+    print(f"Saved raw transaction data: {total_rows} transactions "
+          f"to {args.raw_store if args.raw_format == 'store' else RAW_TRANSACTIONS_FILE}")
+    for key_stats in collector.key_pool.summary():
+        print(f"  {key_stats['key']}: {key_stats['requests']} requests, "
+              f"rate {key_stats['rate']}/s{' (revoked)' if key_stats['revoked'] else ''}")
+    
+    # Engineer features, or reuse the snapshot for this as-of time and data version.
+    # Only a fixed --as-of can be asked for again, so only then are snapshots kept
+    print("\n3. Engineering risk assessment features...")
+    as_of = int(time.time()) if args.as_of is None else args.as_of
+    use_snapshots = args.as_of is not None and not args.no_snapshot
+    features = None
+    if use_snapshots:
+        high_water_block = raw_high_water_block(raw_chunks(['block_number']))
+        snapshots = FeatureSnapshots(args.snapshot_dir)
+        # Everything besides (as_of, block) that changes the feature table. The raw data
+        # fingerprint catches rows added below the high-water block, e.g. by --resume
+        if args.raw_format == 'store':
+            fingerprint = sink.fingerprint()
+        else:
+            fingerprint = raw_fingerprint(_encode_hex(chunk['tx_hash'], 32) for chunk in
+                                          pd.read_csv(RAW_TRANSACTIONS_FILE, usecols=['tx_hash'], chunksize=SINK_BATCH_ROWS))
+        snapshot_config = {'activity_windows': args.activity_windows, 'float32': args.float32_features,
+                           'wallet_list_crc32': zlib.crc32('\n'.join(wallet_addresses).encode()),
+                           'raw_fingerprint': fingerprint}
+        meta = snapshots.read_meta(as_of, high_water_block)
+        if meta is not None and all(meta.get(key) == value for key, value in snapshot_config.items()):
+            features = snapshots.load(as_of, high_water_block)
+            print(f"Reusing feature snapshot {snapshots.path(as_of, high_water_block)}")
+    
+    if features is None:
+        if accumulator is not None:
+            try:
+                features = accumulator.features(wallet_addresses, as_of)
+            except ValueError as e:
+                print(f"Error: {e}")
+                return
+        elif args.raw_format == 'store':
+            features = engineer_compound_features_from_store(sink, wallet_addresses, max_workers=args.feature_workers,
+                                                             as_of=as_of)
+        else:
+            features = engineer_compound_features_from_chunks(raw_chunks(), wallet_addresses, as_of)
+        
+        if args.activity_windows and not features.empty:
+            windows = window_features_from_chunks(raw_chunks(WINDOW_SOURCE_COLUMNS), wallet_addresses,
+                                                  as_of=as_of, windows=args.activity_windows)
+            features = pd.concat([features, windows.drop(columns=['userWallet'])], axis=1)
+            print(f"Added {windows.shape[1] - 1} activity features over {args.activity_windows}-day windows")
+        
+        if not features.empty:
+            compact = compact_features(features, float32=args.float32_features)
+            print(f"Feature memory: {memory_mb(features):.2f} MB -> {memory_mb(compact):.2f} MB compacted")
+            features = compact
+            if use_snapshots:
+                path = snapshots.write(features, as_of, high_water_block, **snapshot_config)
+                print(f"Saved feature snapshot {path}")
     
     if not features.empty:
         # Save features
@@ -417,8 +1945,18 @@ def main():
         print(f"Generated features for {len(features)} wallets")
         
         # Calculate risk scores
-        print("\n3. Calculating risk scores...")
-        features_with_scores = calculate_risk_scores(features)
+        print("\n4. Calculating risk scores...")
+        if rule_sets is not None:
+            scores = rule_sets.score(features)
+            features['score'] = scores[0]
+            if len(rule_sets.names) > 1:
+                variants = pd.DataFrame(scores.T, columns=rule_sets.names)
+                variants.insert(0, 'wallet_id', features['userWallet'].to_numpy())
+                variants.to_csv(SCORE_VARIANTS_FILE, index=False)
+                print(f"Scored {len(rule_sets.names)} rule sets; saved to '{SCORE_VARIANTS_FILE}'")
+            features_with_scores = features
+        else:
+            features_with_scores = calculate_risk_scores(features)
         
         # Save final results in required format
         result_df = features_with_scores[['userWallet', 'score']].copy()
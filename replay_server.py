@@ -0,0 +1,222 @@
+import argparse
+import bisect
+import glob
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from main import (ALL_COMPOUND_CONTRACTS, COMPOUND_V2_CONTRACTS, COMPOUND_V2_FUNCTIONS,
+                  COMPOUND_V3_FUNCTIONS, ETHERSCAN_PAGE_SIZE, TokenBucket)
+
+# Offline stand-in for the Etherscan txlist endpoint, plus the recorder that
+# captures real responses as fixtures for it. Fixtures are one JSON-lines file
+# of raw txlist rows per wallet: <fixture_dir>/<wallet>.jsonl
+
+RATE_LIMIT_RESPONSE = {'status': '0', 'message': 'NOTOK', 'result': 'Max rate limit reached'}
+NO_TRANSACTIONS_RESPONSE = {'status': '0', 'message': 'No transactions found', 'result': []}
+
+class FixtureRecorder:
+    """Captures txlist pages seen by the collector into per-wallet fixture files"""
+    def __init__(self, fixture_dir):
+        self.fixture_dir = fixture_dir
+        os.makedirs(fixture_dir, exist_ok=True)
+
+    def record(self, wallet, page):
+        path = os.path.join(self.fixture_dir, wallet.lower() + '.jsonl')
+        # An empty page still creates the file, so replay knows the wallet has no history
+        with open(path, 'a') as f:
+            for tx in page:
+                f.write(json.dumps(tx) + '\n')
+
+def load_fixtures(fixture_dir):
+    """Load recorded fixtures as {wallet: rows sorted by block}, dropping duplicate hashes"""
+    fixtures = {}
+    for path in glob.glob(os.path.join(fixture_dir, '*.jsonl')):
+        wallet = os.path.basename(path)[:-len('.jsonl')].lower()
+        rows = {}
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    tx = json.loads(line)
+                    rows[tx['hash']] = tx
+        fixtures[wallet] = sorted(rows.values(), key=lambda tx: int(tx['blockNumber']))
+    return fixtures
+
+def synthetic_transactions(wallet, mean_transactions=50, heavy_fraction=0.0,
+                           heavy_transactions=25000, seed=0):
+    """Deterministic fake txlist rows for a wallet, about a third of them Compound calls"""
+    rng = random.Random(zlib.crc32(wallet.lower().encode()) ^ seed)
+    if rng.random() < heavy_fraction:
+        n = heavy_transactions
+    else:
+        n = int(rng.expovariate(1 / mean_transactions)) if mean_transactions else 0
+
+    v2_selectors = list(COMPOUND_V2_FUNCTIONS.values())
+    v3_selectors = list(COMPOUND_V3_FUNCTIONS.values())
+    contracts = list(ALL_COMPOUND_CONTRACTS.values())
+    v2_addresses = set(COMPOUND_V2_CONTRACTS.values())
+
+    block = rng.randint(7_000_000, 12_000_000)
+    rows = []
+    for i in range(n):
+        block += rng.choice([0, 0, 1, 3, 40, 500, 5000])  # several txs per block happen
+        if rng.random() < 0.35:
+            to = rng.choice(contracts)
+            selector = rng.choice(v2_selectors if to in v2_addresses else v3_selectors)
+        else:
+            to = '0x%040x' % rng.getrandbits(160)
+            selector = '0xa9059cbb'  # ERC-20 transfer
+        rows.append({
+            'blockNumber': str(block),
+            'timeStamp': str(1_500_000_000 + block * 13),
+            'hash': '0x%064x' % rng.getrandbits(256),
+            'from': wallet.lower(),
+            'to': to.lower(),
+            'value': str(rng.choice([0, 0, 10 ** 17, 10 ** 18])),
+            'gas': '500000',
+            'gasPrice': str(rng.randint(1, 200) * 10 ** 9),
+            'gasUsed': str(rng.randint(21000, 600000)),
+            'isError': '1' if rng.random() < 0.02 else '0',
+            'input': selector + '%064x' % i,
+        })
+    return rows
+
+class ReplayServer:
+    """Local HTTP server answering txlist requests from fixtures or synthetic data"""
+    def __init__(self, fixtures=None, synthetic=None, latency=0.0, error_rate=0.0,
+                 requests_per_second=None, host='127.0.0.1', port=0, seed=0):
+        self.fixtures = fixtures or {}
+        self.synthetic = synthetic    # kwargs for synthetic_transactions, or None
+        self.latency = latency        # seconds added to every response
+        self.error_rate = error_rate  # fraction of requests answered with HTTP 503
+        self.requests_per_second = requests_per_second  # per API key, None = unlimited
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.limiters = {}
+        self.blocks = {}
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, payload = server.handle(parse_qs(urlparse(self.path).query))
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def wallet_rows(self, wallet):
+        """Rows for a wallet plus their block numbers, generated on first use"""
+        with self.lock:
+            if wallet not in self.blocks:
+                rows = self.fixtures.get(wallet)
+                if rows is None:
+                    rows = synthetic_transactions(wallet, **self.synthetic) if self.synthetic is not None else []
+                    self.fixtures[wallet] = rows
+                self.blocks[wallet] = [int(tx['blockNumber']) for tx in rows]
+            return self.fixtures[wallet], self.blocks[wallet]
+
+    def handle(self, query):
+        """Answer one txlist query; returns (http_status, json_payload)"""
+        param = lambda name, default=None: query.get(name, [default])[0]
+        with self.lock:
+            self.stats['requests'] += 1
+            failed = self.rng.random() < self.error_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            with self.lock:
+                self.stats['errors'] += 1
+            return 503, {'status': '0', 'message': 'Service Unavailable', 'result': ''}
+
+        if self.requests_per_second:
+            key = param('apikey', '')
+            with self.lock:
+                if key not in self.limiters:
+                    rate = self.requests_per_second
+                    self.limiters[key] = TokenBucket(rate, capacity=max(1, rate))
+                limiter = self.limiters[key]
+            if limiter.try_acquire():
+                with self.lock:
+                    self.stats['throttled'] += 1
+                return 200, RATE_LIMIT_RESPONSE
+
+        if param('module') != 'account' or param('action') != 'txlist':
+            return 200, {'status': '0', 'message': 'NOTOK', 'result': 'Error! Unsupported action'}
+
+        rows, blocks = self.wallet_rows(param('address', '').lower())
+        start_block = int(param('startblock', 0))
+        end_block = int(param('endblock', 99999999))
+        page = int(param('page', 1))
+        offset = min(int(param('offset', ETHERSCAN_PAGE_SIZE)), ETHERSCAN_PAGE_SIZE)
+
+        lo = bisect.bisect_left(blocks, start_block)
+        hi = bisect.bisect_right(blocks, end_block)
+        result = rows[lo:hi][(page - 1) * offset:page * offset]
+        if not result:
+            return 200, NO_TRANSACTIONS_RESPONSE
+        return 200, {'status': '1', 'message': 'OK', 'result': result}
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Etherscan txlist API")
+    parser.add_argument('--fixtures', help="Directory of recorded <wallet>.jsonl fixtures")
+    parser.add_argument('--synthetic-mean', type=float, default=50,
+                        help="Mean transactions per unknown wallet (0 = unknown wallets are empty)")
+    parser.add_argument('--heavy-fraction', type=float, default=0.0,
+                        help="Fraction of synthetic wallets with more than one page of history")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of HTTP 503 responses")
+    parser.add_argument('--requests-per-second', type=float, help="Per-key limit before 'Max rate limit reached'")
+    parser.add_argument('--port', type=int, default=8545)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else {}
+    synthetic = {'mean_transactions': args.synthetic_mean, 'heavy_fraction': args.heavy_fraction}
+    server = ReplayServer(fixtures, synthetic, latency=args.latency, error_rate=args.error_rate,
+                          requests_per_second=args.requests_per_second, port=args.port)
+    print(f"Replaying {len(fixtures)} recorded wallets at {server.url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
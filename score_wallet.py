@@ -1,175 +1,579 @@
+import argparse
+import io
+import itertools
 import pandas as pd
 import json
 import numpy as np
+from pandas.api.types import union_categoricals
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import adjusted_rand_score
 import matplotlib.pyplot as plt
 
-# Load JSON file
-try:
-    with open('data/user-wallet-transactions.json', 'r') as f:
-        data = json.load(f)
-    df = pd.DataFrame(data)
-except FileNotFoundError:
-    print("Error: 'data/user-wallet-transactions.json' not found.")
-    exit(1)
-except json.JSONDecodeError:
-    print("Error: Invalid JSON format in 'data/user-wallet-transactions.json'.")
-    exit(1)
-
-# Normalize amount to USD
-def normalize_amount(row):
-    try:
-        amount = int(row['actionData']['amount'])
-        asset_symbol = row['actionData']['assetSymbol']
-        decimals = 6 if asset_symbol in ['USDC'] else 18
-        price_usd = float(row['actionData']['assetPriceUSD'])
-        return (amount / 10**decimals) * price_usd
-    except (KeyError, ValueError, TypeError):
-        return 0.0  # Handle missing or malformed data
-
-df['amount_usd'] = df.apply(normalize_amount, axis=1)
-
-# Feature engineering
-def engineer_features(df):
+DATA_FILE = 'data/user-wallet-transactions.json'
+
+# Token decimals for amount normalization; anything not listed uses 18
+ASSET_DECIMALS = {'USDC': 6}
+DEFAULT_DECIMALS = 18
+
+# Aave actions the features count and sum
+ACTIONS = ['deposit', 'borrow', 'repay', 'redeemunderlying', 'liquidationcall']
+
+# Streaming loader: records are parsed a bounded chunk at a time and only
+# the typed columns the features use are kept from each chunk
+LOADER_CHUNK_ROWS = 100000
+LOADER_BUFFER_CHARS = 1 << 20
+RECORD_COLUMNS = ['userWallet', 'action', 'timestamp', 'actionData']
+TRANSACTION_COLUMNS = ['userWallet', 'action', 'timestamp', 'assetSymbol', 'amount_usd']
+CATEGORY_COLUMNS = ['userWallet', 'action', 'assetSymbol']
+
+# Clustering model saved by --mode train and reused by --mode predict
+MODEL_FILE = 'wallet_model.npz'
+N_CLUSTERS = 5
+# --minibatch: wallets are scaled and clustered a chunk at a time, so the
+# scaled matrix of the whole population is never built
+CLUSTER_CHUNK_ROWS = 100000
+CLUSTER_BATCH_ROWS = 16384  # rows per MiniBatchKMeans update within a chunk
+CLUSTER_EPOCHS = 1  # passes of mini-batch updates over all chunks
+
+def iter_json_records(path, buffer_chars=LOADER_BUFFER_CHARS):
+    """Yield records one at a time from a JSON array or a JSON-lines file"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buf = f.read(buffer_chars)
+        while buf and buf.isspace():
+            buf = f.read(buffer_chars)
+        buf = buf.lstrip()
+        if not buf.startswith('['):
+            # JSON lines: finish the partial last line of the buffer, then read by line
+            head = buf + f.readline()
+            for line in itertools.chain(io.StringIO(head), f):
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        # Elements are separated by exactly one ',': after an element only ',' or
+        # ']' may follow, after a ',' only another element
+        pos, eof = 1, False
+        after_element = after_comma = False
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']' and not after_comma:
+                # Only whitespace may follow the array
+                rest = buf[pos + 1:]
+                while True:
+                    if rest.strip():
+                        raise json.JSONDecodeError("Extra data", rest, len(rest) - len(rest.lstrip()))
+                    if eof:
+                        return
+                    rest = f.read(buffer_chars)
+                    eof = not rest
+            if pos < len(buf) and after_element:
+                if buf[pos] != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+                pos += 1
+                after_element, after_comma = False, True
+                continue
+            if pos < len(buf):
+                try:
+                    record, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as err:
+                    # Malformed input fails now; only an element cut off by the buffer reads on
+                    if eof or not _may_be_truncated(err):
+                        raise
+                else:
+                    # A value touching the end of the buffer may continue past it
+                    if end < len(buf) or eof:
+                        yield record
+                        pos = end
+                        after_element, after_comma = True, False
+                        continue
+            elif eof:
+                raise json.JSONDecodeError("Unterminated array", buf, pos)
+            more = f.read(buffer_chars)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+
+def _may_be_truncated(err):
+    """Whether a decode error could go away with more input: it is at the end of the
+    buffer, in a string that runs to the end, or only a cut-short literal, number or
+    escape like 'tru', '1.' or '\\u00' follows it"""
+    tail = err.doc[err.pos:]
+    if err.msg.startswith('Unterminated string') or not tail.strip():
+        return True
+    return len(tail) <= len('-Infinity') and not any(c in tail for c in ' \t\r\n,:{}[]"')
+
+def iter_transaction_chunks(path=DATA_FILE, chunk_rows=LOADER_CHUNK_ROWS, record_keys=None):
+    """Yield typed, USD-normalized transaction batches of at most chunk_rows rows
+    
+    record_keys, if given, is a set that collects every top-level key seen; see record_width().
+    """
+    records = []
+    for record in iter_json_records(path):
+        records.append(record)
+        if record_keys is not None:
+            record_keys.update(record)
+        if len(records) >= chunk_rows:
+            yield transactions_from_records(records)
+            records = []
+    if records:
+        yield transactions_from_records(records)
+
+def transactions_from_records(records):
+    df = pd.DataFrame.from_records(records, columns=RECORD_COLUMNS)
+    df['timestamp'] = pd.to_numeric(df['timestamp'])
+    df = prepare_transactions(df)[TRANSACTION_COLUMNS]
+    # Repeated strings are stored once per batch instead of once per row
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].astype('category')
+    return df
+
+def concat_transactions(chunks):
+    """Concatenate typed batches, keeping the string columns categorical"""
+    if not chunks:
+        return pd.DataFrame(columns=TRANSACTION_COLUMNS)
+    df = pd.DataFrame({
+        column: union_categoricals([chunk[column] for chunk in chunks]) if column in CATEGORY_COLUMNS
+        else np.concatenate([chunk[column].to_numpy() for chunk in chunks])
+        for column in TRANSACTION_COLUMNS
+    })
+    return df
+
+# The whole export as one typed frame, read in batches
+def load_transactions(path=DATA_FILE, chunk_rows=LOADER_CHUNK_ROWS, record_keys=None):
+    return concat_transactions(list(iter_transaction_chunks(path, chunk_rows, record_keys)))
+
+# Flatten the nested actionData dicts into typed columns, once
+def flatten_action_data(df):
+    records = [d if isinstance(d, dict) else {} for d in df['actionData']]
+    flat = pd.DataFrame.from_records(records, columns=['amount', 'assetSymbol', 'assetPriceUSD'], index=df.index)
+    df = df.drop(columns=['actionData'])
+    df['amount'] = pd.to_numeric(flat['amount'], errors='coerce')
+    df['assetSymbol'] = flat['assetSymbol']
+    df['assetPriceUSD'] = pd.to_numeric(flat['assetPriceUSD'], errors='coerce')
+    return df
+
+# Normalize amount to USD as one array op; missing or malformed data counts as 0
+def normalize_amounts(df):
+    decimals = df['assetSymbol'].map(ASSET_DECIMALS).fillna(DEFAULT_DECIMALS).to_numpy(np.float64)
+    amount_usd = df['amount'].to_numpy(np.float64) / np.power(10.0, decimals) * df['assetPriceUSD'].to_numpy(np.float64)
+    valid = df['assetSymbol'].notna().to_numpy() & np.isfinite(amount_usd)
+    return pd.Series(np.where(valid, amount_usd, 0.0), index=df.index, name='amount_usd')
+
+# Per-wallet partial aggregates; states from different chunks merge with
+# sum/min/max, so features can be built chunk by chunk
+STATE_COUNT_COLUMNS = [f'count_{action}' for action in ACTIONS]
+STATE_USD_COLUMNS = [f'usd_{action}' for action in ACTIONS]
+STATE_MERGE = {
+    **{column: 'sum' for column in STATE_COUNT_COLUMNS + STATE_USD_COLUMNS},
+    'total_transactions': 'sum',
+    'total_usd': 'sum',
+    'first_timestamp': 'min',
+    'last_timestamp': 'max',
+}
+ASSET_PREFIX = 'asset_'  # one 0/1 column per asset symbol seen, merged with max
+STATE_MERGE_ROWS = 1000000
+
+def empty_feature_state():
+    float_columns = STATE_USD_COLUMNS + ['total_usd']
+    state = pd.DataFrame({column: np.array([], dtype=np.float64 if column in float_columns else np.int64)
+                          for column in STATE_MERGE})
+    state.index = pd.Index([], dtype=object, name='userWallet')
+    return state
+
+def compute_feature_state(df):
+    """Partial aggregates for one chunk: counts and USD sums per action from one
+    (wallet, action) groupby, assets from one (wallet, asset) groupby, the rest
+    from one per-wallet agg"""
     if df.empty:
-        print("Error: Input DataFrame is empty.")
-        return pd.DataFrame()
+        return empty_feature_state()
+    
+    by_action = df.groupby(['userWallet', 'action'], observed=True)['amount_usd'].agg(['size', 'sum']).unstack(fill_value=0)
+    assets = df.groupby(['userWallet', 'assetSymbol'], observed=True).size().unstack(fill_value=0) > 0
+    stats = df.groupby('userWallet', observed=True).agg(
+        total_transactions=('action', 'size'),
+        total_usd=('amount_usd', 'sum'),
+        first_timestamp=('timestamp', 'min'),
+        last_timestamp=('timestamp', 'max'))
+    counts = by_action['size'].reindex(index=stats.index, columns=ACTIONS, fill_value=0)
+    usd = by_action['sum'].reindex(index=stats.index, columns=ACTIONS, fill_value=0.0)
+    assets = assets.reindex(index=stats.index, fill_value=False)
+    
+    columns = {}
+    for action, column in zip(ACTIONS, STATE_COUNT_COLUMNS):
+        columns[column] = counts[action].to_numpy(np.int64)
+    for action, column in zip(ACTIONS, STATE_USD_COLUMNS):
+        columns[column] = usd[action].to_numpy(np.float64)
+    columns['total_transactions'] = stats['total_transactions'].to_numpy(np.int64)
+    columns['total_usd'] = stats['total_usd'].to_numpy(np.float64)
+    columns['first_timestamp'] = stats['first_timestamp'].to_numpy(np.int64)
+    columns['last_timestamp'] = stats['last_timestamp'].to_numpy(np.int64)
+    for symbol in assets.columns:
+        columns[ASSET_PREFIX + str(symbol)] = assets[symbol].to_numpy(np.int64)
+    state = pd.DataFrame(columns, index=pd.Index(np.asarray(stats.index.astype(str), dtype=object), name='userWallet'))
+    return state.sort_index()
+
+def merge_feature_states(*states):
+    """Combine partial states; counts, timestamps and assets merge exactly, USD sums up to float rounding"""
+    states = [state for state in states if not state.empty]
+    if not states:
+        return empty_feature_state()
+    if len(states) == 1:
+        return states[0]
+    combined = pd.concat(states)
+    asset_columns = sorted(column for column in combined.columns if column.startswith(ASSET_PREFIX))
+    # An asset missing from one chunk's state simply was not used in that chunk
+    combined[asset_columns] = combined[asset_columns].fillna(0).astype(np.int64)
+    merged = combined.groupby(level=0, sort=True).agg({**STATE_MERGE, **{column: 'max' for column in asset_columns}})
+    merged.index.name = 'userWallet'
+    return merged
+
+def feature_state_from_chunks(chunks, merge_rows=STATE_MERGE_ROWS):
+    """Merged state of a stream of transaction chunks, folding partials every merge_rows"""
+    state = empty_feature_state()
+    pending, pending_rows = [], 0
+    for chunk in chunks:
+        partial = compute_feature_state(chunk)
+        pending.append(partial)
+        pending_rows += len(partial)
+        if pending_rows >= merge_rows:
+            state = merge_feature_states(state, *pending)
+            pending, pending_rows = [], 0
+    return merge_feature_states(state, *pending)
+
+def _ratio(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros(len(numerator)), where=denominator > 0)
+
+def record_width(record_keys):
+    """Columns per row of a wallet's group in the original engineer_features: every
+    top-level record key plus amount_usd, without the userWallet group key"""
+    return len(set(record_keys) | {'amount_usd'}) - 1
+
+# Feature engineering: every feature is derived from the per-wallet state.
+# liquidation_to_total_ratio and tx_frequency keep the original definition,
+# which divided by the group's DataFrame.size (rows x row_width), not its rows
+def features_from_state(state, row_width):
+    n = state['total_transactions'].to_numpy()
+    size = n * row_width
+    span_days = (state['last_timestamp'] - state['first_timestamp']).to_numpy(np.float64) / (24 * 3600)
+    counts = {action: state[column].to_numpy() for action, column in zip(ACTIONS, STATE_COUNT_COLUMNS)}
+    usd = {action: state[column].to_numpy() for action, column in zip(ACTIONS, STATE_USD_COLUMNS)}
+    asset_columns = [column for column in state.columns if column.startswith(ASSET_PREFIX)]
+    liquidations = counts['liquidationcall']
     
-    grouped = df.groupby('userWallet')
     features = pd.DataFrame({
-        'num_deposits': grouped.apply(lambda x: (x['action'] == 'deposit').sum(), include_groups=False),
-        'num_borrows': grouped.apply(lambda x: (x['action'] == 'borrow').sum(), include_groups=False),
-        'num_repays': grouped.apply(lambda x: (x['action'] == 'repay').sum(), include_groups=False),
-        'num_redeems': grouped.apply(lambda x: (x['action'] == 'redeemunderlying').sum(), include_groups=False),
-        'num_liquidations': grouped.apply(lambda x: (x['action'] == 'liquidationcall').sum(), include_groups=False),
-        'total_transactions': grouped.size(),
-        'total_deposit_usd': grouped.apply(lambda x: x[x['action'] == 'deposit']['amount_usd'].sum(), include_groups=False),
-        'total_borrow_usd': grouped.apply(lambda x: x[x['action'] == 'borrow']['amount_usd'].sum(), include_groups=False),
-        'total_repay_usd': grouped.apply(lambda x: x[x['action'] == 'repay']['amount_usd'].sum(), include_groups=False),
-        'total_redeem_usd': grouped.apply(lambda x: x[x['action'] == 'redeemunderlying']['amount_usd'].sum(), include_groups=False),
-        'net_borrow_usd': grouped.apply(lambda x: x[x['action'] == 'borrow']['amount_usd'].sum() - 
-                                       x[x['action'] == 'repay']['amount_usd'].sum(), include_groups=False),
-        'repay_to_borrow_ratio': grouped.apply(lambda x: x[x['action'] == 'repay']['amount_usd'].sum() / 
-                                              x[x['action'] == 'borrow']['amount_usd'].sum() if x[x['action'] == 'borrow']['amount_usd'].sum() > 0 else 0, 
-                                              include_groups=False),
-        'borrow_to_deposit_ratio': grouped.apply(lambda x: x[x['action'] == 'borrow']['amount_usd'].sum() / 
-                                                x[x['action'] == 'deposit']['amount_usd'].sum() if x[x['action'] == 'deposit']['amount_usd'].sum() > 0 else 0, 
-                                                include_groups=False),
-        'redeem_to_deposit_ratio': grouped.apply(lambda x: x[x['action'] == 'redeemunderlying']['amount_usd'].sum() / 
-                                                x[x['action'] == 'deposit']['amount_usd'].sum() if x[x['action'] == 'deposit']['amount_usd'].sum() > 0 else 0, 
-                                                include_groups=False),
-        'has_liquidation': grouped.apply(lambda x: (x['action'] == 'liquidationcall').any().astype(int), include_groups=False),
-        'liquidation_to_total_ratio': grouped.apply(lambda x: (x['action'] == 'liquidationcall').sum() / x.size if x.size > 0 else 0, include_groups=False),
-        'wallet_age_days': grouped['timestamp'].apply(lambda x: (x.max() - x.min()) / (24 * 3600)),
-        'tx_frequency': grouped.apply(lambda x: x.size / ((x['timestamp'].max() - x['timestamp'].min()) / (24 * 3600)) if (x['timestamp'].max() - x['timestamp'].min()) > 0 else 0, include_groups=False),
-        'num_unique_assets': grouped['actionData'].apply(lambda x: x.apply(lambda y: y['assetSymbol']).nunique()),
-        'avg_transaction_usd': grouped['amount_usd'].mean()
-    }).fillna(0)
+        'num_deposits': counts['deposit'],
+        'num_borrows': counts['borrow'],
+        'num_repays': counts['repay'],
+        'num_redeems': counts['redeemunderlying'],
+        'num_liquidations': liquidations,
+        'total_transactions': n,
+        'total_deposit_usd': usd['deposit'],
+        'total_borrow_usd': usd['borrow'],
+        'total_repay_usd': usd['repay'],
+        'total_redeem_usd': usd['redeemunderlying'],
+        'net_borrow_usd': usd['borrow'] - usd['repay'],
+        'repay_to_borrow_ratio': _ratio(usd['repay'], usd['borrow']),
+        'borrow_to_deposit_ratio': _ratio(usd['borrow'], usd['deposit']),
+        'redeem_to_deposit_ratio': _ratio(usd['redeemunderlying'], usd['deposit']),
+        'has_liquidation': (liquidations > 0).astype(int),
+        'liquidation_to_total_ratio': liquidations / size,
+        'wallet_age_days': span_days,
+        'tx_frequency': _ratio(size.astype(np.float64), span_days),
+        'num_unique_assets': state[asset_columns].to_numpy().sum(axis=1),
+        'avg_transaction_usd': state['total_usd'].to_numpy() / n
+    }, index=state.index).fillna(0)
     return features.reset_index()
 
-features = engineer_features(df)
-if features.empty:
-    print("Error: No features generated. Exiting.")
-    exit(1)
+def engineer_features(df, record_keys):
+    """Features of a load_transactions() frame; record_keys are the keys it collected"""
+    if df.empty:
+        print("Error: Input DataFrame is empty.")
+        return pd.DataFrame()
+    return features_from_state(compute_feature_state(df), record_width(record_keys))
+
+def engineer_features_from_chunks(chunks, record_keys):
+    """engineer_features for exports bigger than memory, e.g. iter_transaction_chunks();
+    record_keys is only read once every chunk has been consumed"""
+    state = feature_state_from_chunks(chunks)
+    if state.empty:
+        print("Error: Input DataFrame is empty.")
+        return pd.DataFrame()
+    return features_from_state(state, record_width(record_keys))
 
+# Flattened, USD-normalized transactions ready for engineer_features
+def prepare_transactions(df):
+    df = flatten_action_data(df)
+    df['amount_usd'] = normalize_amounts(df)
+    return df
 
+# Base score per cluster id, looked up for all wallets at once
+CLUSTER_BASE_SCORES = np.array([
+    800,  # 0 Reliable: high repay, low liquidation
+    600,  # 1 Moderate-high
+    400,  # 2 Moderate
+    200,  # 3 Moderate-low
+    0,    # 4 Risky: high liquidation, low repay
+])
 
-# Normalize features
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(features.drop(columns=['userWallet']))
+class WalletModel:
+    """Fitted scaler, KMeans centroids and cluster base scores, saved as one small .npz
+    
+    Prediction is plain numpy (standardize, nearest centroid), so scoring new or
+    updated wallets needs neither a refit nor sklearn, and cluster ids stay the
+    ones the model was trained with.
+    """
+    def __init__(self, columns, mean, scale, centroids, base_scores=CLUSTER_BASE_SCORES):
+        self.columns = list(columns)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.base_scores = np.asarray(base_scores)
+    
+    @classmethod
+    def fit(cls, features):
+        """Fit the scaler and KMeans on these wallets; returns the model and their cluster labels"""
+        X = features.drop(columns=['userWallet'])
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
+        kmeans = KMeans(n_clusters=N_CLUSTERS, random_state=42)
+        labels = kmeans.fit_predict(X_scaled)
+        return cls(X.columns, scaler.mean_, scaler.scale_, kmeans.cluster_centers_), labels
+    
+    @classmethod
+    def fit_minibatch(cls, chunks, epochs=CLUSTER_EPOCHS):
+        """Fit from feature chunks with StandardScaler and MiniBatchKMeans partial_fit
+        
+        chunks() must return a fresh iterator of feature frames: one pass
+        collects the scaler statistics, then each epoch is one pass of
+        mini-batch updates, with only the current chunk ever scaled. Centers
+        start from full KMeans on the first chunk; a k-means++ seed from a
+        single mini-batch lands in clearly worse clusterings on this data.
+        """
+        scaler = StandardScaler()
+        columns = None
+        for chunk in chunks():
+            X = chunk.drop(columns=['userWallet'])
+            columns = X.columns
+            scaler.partial_fit(X)
+        first = scaler.transform(next(iter(chunks())).drop(columns=['userWallet']))
+        init = KMeans(n_clusters=N_CLUSTERS, random_state=42).fit(first).cluster_centers_
+        kmeans = MiniBatchKMeans(n_clusters=N_CLUSTERS, init=init, n_init=1, random_state=42,
+                                 batch_size=CLUSTER_BATCH_ROWS)
+        for _ in range(epochs):
+            for chunk in chunks():
+                X_scaled = scaler.transform(chunk.drop(columns=['userWallet']))
+                for start in range(0, len(X_scaled), CLUSTER_BATCH_ROWS):
+                    kmeans.partial_fit(X_scaled[start:start + CLUSTER_BATCH_ROWS])
+        return cls(columns, scaler.mean_, scaler.scale_, kmeans.cluster_centers_)
+    
+    def save(self, path=MODEL_FILE):
+        np.savez(path, columns=np.array(self.columns), mean=self.mean, scale=self.scale,
+                 centroids=self.centroids, base_scores=self.base_scores)
+    
+    @classmethod
+    def load(cls, path=MODEL_FILE):
+        with np.load(path) as data:
+            return cls(data['columns'].tolist(), data['mean'], data['scale'], data['centroids'], data['base_scores'])
+    
+    def standardize(self, features):
+        """Scaled feature matrix of a frame with the model's columns, or of rows
+        already in self.columns order (which skips the pandas overhead for a single wallet)"""
+        if isinstance(features, pd.DataFrame):
+            missing = [column for column in self.columns if column not in features.columns]
+            if missing:
+                raise ValueError(f"Features are missing model columns: {missing}")
+            features = features[self.columns].to_numpy(dtype=np.float64)
+        return (np.asarray(features, dtype=np.float64).reshape(-1, len(self.columns)) - self.mean) / self.scale
+    
+    def _centroid_distances(self, X):
+        # |x - c|^2 without the per-wallet |x|^2 term, which does not change the nearest centroid
+        return (self.centroids ** 2).sum(axis=1) - 2 * X @ self.centroids.T
+    
+    def predict(self, features):
+        """Cluster of each wallet: nearest centroid in the standardized feature space"""
+        return self._centroid_distances(self.standardize(features)).argmin(axis=1)
+    
+    def inertia(self, chunks):
+        """Sum of squared distances from each wallet to its nearest centroid, over feature chunks"""
+        total = 0.0
+        for chunk in chunks:
+            X = self.standardize(chunk)
+            total += float(((X ** 2).sum(axis=1) + self._centroid_distances(X).min(axis=1)).sum())
+        return total
 
-# Clustering
-kmeans = KMeans(n_clusters=5, random_state=42)
-features['cluster'] = kmeans.fit_predict(X_scaled)
+def iter_feature_chunks(features, chunk_rows=CLUSTER_CHUNK_ROWS):
+    """Consecutive row slices of the feature table"""
+    for start in range(0, len(features), chunk_rows):
+        yield features.iloc[start:start + chunk_rows]
 
+def cluster_wallets(features, model=None, minibatch=False, chunk_rows=CLUSTER_CHUNK_ROWS):
+    """Cluster wallets with a trained model, or fit a new one on them; returns (features, model)
+    
+    minibatch fits from chunks of chunk_rows wallets instead of the whole
+    population at once, for populations too large for full-batch KMeans.
+    """
+    if model is None and minibatch:
+        model = WalletModel.fit_minibatch(lambda: iter_feature_chunks(features, chunk_rows))
+    if model is None:
+        model, labels = WalletModel.fit(features)
+    else:
+        labels = np.concatenate([model.predict(chunk) for chunk in iter_feature_chunks(features, chunk_rows)])
+    features['cluster'] = labels
+    return features, model
 
+def compare_to_full_batch(features, model, chunk_rows=CLUSTER_CHUNK_ROWS):
+    """Cluster quality of a (mini-batch) model against full-batch KMeans on the same wallets
+    
+    Returns both inertias and the adjusted Rand index of the two labelings,
+    which is 1.0 when they group the wallets identically.
+    """
+    features = features.drop(columns=['cluster'], errors='ignore')
+    baseline, baseline_labels = WalletModel.fit(features)
+    labels = np.concatenate([model.predict(chunk) for chunk in iter_feature_chunks(features, chunk_rows)])
+    return {
+        'inertia': model.inertia(iter_feature_chunks(features, chunk_rows)),
+        'baseline_inertia': baseline.inertia(iter_feature_chunks(features, chunk_rows)),
+        'adjusted_rand_index': adjusted_rand_score(baseline_labels, labels),
+    }
 
 # Assign scores
-def assign_scores(features):
-    scores = []
-    for _, row in features.iterrows():
-        cluster = row['cluster']
-        base_score = {
-            0: 800,  # Reliable: high repay, low liquidation
-            1: 600,  # Moderate-high
-            2: 400,  # Moderate
-            3: 200,  # Moderate-low
-            4: 0     # Risky: high liquidation, low repay
-        }[cluster]
-        # Adjust score based on key features
-        adjustment = (row['repay_to_borrow_ratio'] * 100 - 
-                      row['liquidation_to_total_ratio'] * 200 - 
-                      row['borrow_to_deposit_ratio'] * 50 + 
-                      row['wallet_age_days'] * 0.1)
-        score = min(max(base_score + adjustment, 0), 1000)
-        scores.append(score)
-    features['score'] = scores
+def assign_scores(features, base_scores=CLUSTER_BASE_SCORES):
+    base_score = np.asarray(base_scores)[features['cluster'].to_numpy()]
+    # Adjust score based on key features
+    adjustment = (features['repay_to_borrow_ratio'].to_numpy() * 100 -
+                  features['liquidation_to_total_ratio'].to_numpy() * 200 -
+                  features['borrow_to_deposit_ratio'].to_numpy() * 50 +
+                  features['wallet_age_days'].to_numpy() * 0.1)
+    # Same comparisons as min(max(score, 0), 1000), so NaN passes through unchanged
+    score = base_score + adjustment
+    score = np.where(0 > score, 0, score)
+    features['score'] = np.where(1000 < score, 1000, score)
     return features
 
-features = assign_scores(features)
-
-# Save scores
-features[['userWallet', 'score']].to_csv('wallet_scores.csv', index=False)
-
 # Score distribution chart
-score_ranges = pd.cut(features['score'], bins=range(0, 1100, 100), right=False)
-score_dist = score_ranges.value_counts().sort_index()
-
-chart = {
-    "type": "bar",
-    "data": {
-        "labels": [f"{i}-{i+100}" for i in range(0, 1000, 100)],
-        "datasets": [{
-            "label": "Wallet Score Distribution",
-            "data": score_dist.values.tolist(),
-            "backgroundColor": ["#36A2EB", "#FF6384", "#FFCE56", "#4BC0C0", "#9966FF", 
-                              "#FF9F40", "#66BB6A", "#EF5350", "#26A69A", "#AB47BC"],
-            "borderColor": ["#2E86C1", "#E91E63", "#FFB300", "#26A69A", "#7B1FA2", 
-                           "#F57C00", "#388E3C", "#C62828", "#00897B", "#8E24AA"],
-            "borderWidth": 1
-        }]
-    },
-    "options": {
-        "scales": {
-            "y": {
-                "beginAtZero": True,
-                "title": {
-                    "display": True,
-                    "text": "Number of Wallets"
+def write_score_distribution(features):
+    score_ranges = pd.cut(features['score'], bins=range(0, 1100, 100), right=False)
+    score_dist = score_ranges.value_counts().sort_index()
+
+    chart = {
+        "type": "bar",
+        "data": {
+            "labels": [f"{i}-{i+100}" for i in range(0, 1000, 100)],
+            "datasets": [{
+                "label": "Wallet Score Distribution",
+                "data": score_dist.values.tolist(),
+                "backgroundColor": ["#36A2EB", "#FF6384", "#FFCE56", "#4BC0C0", "#9966FF", 
+                                  "#FF9F40", "#66BB6A", "#EF5350", "#26A69A", "#AB47BC"],
+                "borderColor": ["#2E86C1", "#E91E63", "#FFB300", "#26A69A", "#7B1FA2", 
+                               "#F57C00", "#388E3C", "#C62828", "#00897B", "#8E24AA"],
+                "borderWidth": 1
+            }]
+        },
+        "options": {
+            "scales": {
+                "y": {
+                    "beginAtZero": True,
+                    "title": {
+                        "display": True,
+                        "text": "Number of Wallets"
+                    }
+                },
+                "x": {
+                    "title": {
+                        "display": True,
+                        "text": "Score Range"
+                    }
                 }
             },
-            "x": {
+            "plugins": {
+                "legend": {
+                    "display": False
+                },
                 "title": {
                     "display": True,
-                    "text": "Score Range"
+                    "text": "Wallet Credit Score Distribution"
                 }
             }
-        },
-        "plugins": {
-            "legend": {
-                "display": False
-            },
-            "title": {
-                "display": True,
-                "text": "Wallet Credit Score Distribution"
-            }
         }
     }
-}
 
-# Save chart configuration
-with open('score_distribution.json', 'w') as f:
-    json.dump(chart, f, indent=2)
-
-# Plot for visualization (optional, for local testing)
-plt.bar([f"{i}-{i+100}" for i in range(0, 1000, 100)], score_dist.values, 
-        color=["#36A2EB", "#FF6384", "#FFCE56", "#4BC0C0", "#9966FF", 
-               "#FF9F40", "#66BB6A", "#EF5350", "#26A69A", "#AB47BC"])
-plt.xlabel('Score Range')
-plt.ylabel('Number of Wallets')
-plt.title('Wallet Credit Score Distribution')
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.savefig('score_distribution.png')
-plt.close()
+    # Save chart configuration
+    with open('score_distribution.json', 'w') as f:
+        json.dump(chart, f, indent=2)
+
+    # Plot for visualization (optional, for local testing)
+    plt.bar([f"{i}-{i+100}" for i in range(0, 1000, 100)], score_dist.values, 
+            color=["#36A2EB", "#FF6384", "#FFCE56", "#4BC0C0", "#9966FF", 
+                   "#FF9F40", "#66BB6A", "#EF5350", "#26A69A", "#AB47BC"])
+    plt.xlabel('Score Range')
+    plt.ylabel('Number of Wallets')
+    plt.title('Wallet Credit Score Distribution')
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.savefig('score_distribution.png')
+    plt.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Aave V2 wallet credit scoring")
+    parser.add_argument('--input', default=DATA_FILE,
+                        help="Transactions as a JSON array or JSON lines, one object per transaction")
+    parser.add_argument('--chunk-rows', type=int, default=LOADER_CHUNK_ROWS,
+                        help="Transactions parsed and converted per batch while loading")
+    parser.add_argument('--mode', choices=['train', 'predict'], default='train',
+                        help="train: fit the scaler and clusters on these wallets and save them to --model; "
+                             "predict: score these wallets with the saved model, without refitting")
+    parser.add_argument('--model', default=MODEL_FILE, help="Model artifact written by train, read by predict")
+    parser.add_argument('--minibatch', action='store_true',
+                        help="Train with incremental scaling and MiniBatchKMeans over wallet chunks, "
+                             "for populations too large for full-batch KMeans")
+    parser.add_argument('--cluster-chunk-rows', type=int, default=CLUSTER_CHUNK_ROWS,
+                        help="Wallets per chunk for --minibatch training and for predicting clusters")
+    parser.add_argument('--compare-full-batch', action='store_true',
+                        help="With --minibatch, also fit full-batch KMeans and report how the clusters compare")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    # Chunks are reduced to per-wallet state as they are parsed; the full
+    # transaction table is never held in memory
+    try:
+        record_keys = set()
+        features = engineer_features_from_chunks(iter_transaction_chunks(args.input, args.chunk_rows, record_keys),
+                                                 record_keys)
+    except FileNotFoundError:
+        print(f"Error: '{args.input}' not found.")
+        exit(1)
+    except json.JSONDecodeError:
+        print(f"Error: Invalid JSON format in '{args.input}'.")
+        exit(1)
+    if features.empty:
+        print("Error: No features generated. Exiting.")
+        exit(1)
+
+    if args.mode == 'predict':
+        try:
+            model = WalletModel.load(args.model)
+        except FileNotFoundError:
+            print(f"Error: model '{args.model}' not found; run with --mode train first.")
+            exit(1)
+        features, model = cluster_wallets(features, model, chunk_rows=args.cluster_chunk_rows)
+    else:
+        features, model = cluster_wallets(features, minibatch=args.minibatch, chunk_rows=args.cluster_chunk_rows)
+        if args.minibatch and args.compare_full_batch:
+            quality = compare_to_full_batch(features, model, args.cluster_chunk_rows)
+            print(f"Mini-batch vs full-batch KMeans: inertia {quality['inertia']:.1f} vs "
+                  f"{quality['baseline_inertia']:.1f} ({quality['inertia'] / quality['baseline_inertia'] - 1:+.2%}), "
+                  f"adjusted Rand index {quality['adjusted_rand_index']:.3f}")
+        model.save(args.model)
+        print(f"Saved model to '{args.model}'")
+    features = assign_scores(features, model.base_scores)
+
+    # Save scores
+    features[['userWallet', 'score']].to_csv('wallet_scores.csv', index=False)
+    write_score_distribution(features)
+
+if __name__ == "__main__":
+    main()